@@ -0,0 +1,148 @@
+import asyncio
+import random
+from collections import deque
+
+from solutions.object_oriented_design.call_center.call_center import \
+    CallCenter, CallState, Rank
+
+
+class AsyncCallCenter(CallCenter):
+    """CallCenter run on asyncio, with one worker coroutine per employee.
+
+    dispatch_call admits a call into the per-rank queues and wakes an idle
+    worker that can take it.  A worker takes the best queued call for its
+    rank, holds it for service_time(call, employee) seconds, then escalates
+    it with escalation_probability or completes it.  Escalated calls go
+    back into the queues without waiting for a higher-rank worker, and
+    are not counted against admission.
+
+    At most max_queued calls wait at once.  A call arriving when that many
+    are waiting is rejected, or with shed set the longest-waiting call is
+    dropped to make room for it.
+    """
+
+    def __init__(self, operators, supervisors, directors, max_queued=10000, shed=False,
+                 mean_service_time=1.0, service_time=None, escalation_probability=0.0,
+                 seed=None, **kwargs):
+        super(AsyncCallCenter, self).__init__(operators, supervisors, directors, **kwargs)
+        self.max_queued = max_queued
+        self.shed = shed
+        self.rng = random.Random(seed)
+        self.service_time = service_time or \
+            (lambda call, employee: self.rng.expovariate(1.0 / mean_service_time))
+        self.escalation_probability = escalation_probability
+        self.idle_workers = {rank: deque() for rank in Rank}  # futures of idle workers
+        self.workers_for_call = {
+            rank: [self.idle_workers[other] for other in Rank if other.value >= rank.value]
+            for rank in Rank}
+        self.arrival_order = deque()  # (queued_at, call), only kept when shedding
+        self.num_waiting = 0
+        self.num_active = 0  # admitted and neither completed nor dropped
+        self.max_active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.completed = 0
+        self.escalated = 0
+        self.workers = []
+        self.all_done = None
+
+    def start(self):
+        self.all_done = asyncio.Event()
+        self.all_done.set()
+        self.workers = [asyncio.ensure_future(self._work(employee))
+                        for employee in self.operators + self.supervisors + self.directors]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def join(self):
+        """Wait until every admitted call is completed or dropped."""
+        await self.all_done.wait()
+
+    def dispatch_call(self, call):
+        """Admit the call; return False if it was rejected."""
+        if call.rank not in self.workers_for_call:
+            raise ValueError('Invalid call rank: {}'.format(call.rank))
+        if self.num_waiting >= self.max_queued:
+            if not self.shed:
+                self.rejected += 1
+                return False
+            self._drop_longest_waiting()
+        self.admitted += 1
+        self.num_active += 1
+        self.max_active = max(self.max_active, self.num_active)
+        self.all_done.clear()
+        self._enqueue(call)
+        return True
+
+    def _enqueue(self, call):
+        self._queue_call(call)
+        self.num_waiting += 1
+        if self.shed:
+            self.arrival_order.append((call.queued_at, call))
+        for idle_workers in self.workers_for_call[call.rank]:
+            while idle_workers:
+                waiter = idle_workers.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+
+    def _drop_longest_waiting(self):
+        while self.arrival_order:
+            queued_at, call = self.arrival_order.popleft()
+            # skip entries for calls served, dropped or re-queued since
+            if call.queued_at == queued_at and call.state == CallState.READY:
+                call.state = CallState.DROPPED
+                call.queued_at = None
+                self.num_waiting -= 1
+                self.dropped += 1
+                self._finish_call()
+                return
+
+    def _pop_queued_call(self, rank):
+        while True:
+            call = super(AsyncCallCenter, self)._pop_queued_call(rank)
+            if call is None or call.state != CallState.DROPPED:
+                return call
+
+    def _finish_call(self):
+        self.num_active -= 1
+        if not self.num_active:
+            self.all_done.set()
+
+    async def _work(self, employee):
+        loop = asyncio.get_running_loop()
+        while True:
+            call = self._pop_queued_call(employee.rank)
+            if call is None:
+                waiter = loop.create_future()
+                self.idle_workers[employee.rank].append(waiter)
+                await waiter
+                continue
+            self.num_waiting -= 1
+            self._record_wait(call)
+            employee.take_call(call)
+            await asyncio.sleep(self.service_time(call, employee))
+            if employee.rank != Rank.DIRECTOR and \
+                    self.rng.random() < self.escalation_probability:
+                employee.escalate_call()
+            else:
+                employee.complete_call()
+
+    def notify_call_escalated(self, call):
+        self.escalated += 1
+        call.employee = None
+        self._enqueue(call)
+
+    def notify_call_completed(self, call):
+        self.completed += 1
+        self._finish_call()
+
+    def stats(self):
+        return {'admitted': self.admitted, 'rejected': self.rejected, 'dropped': self.dropped,
+                'completed': self.completed, 'escalated': self.escalated,
+                'max_active': self.max_active}
@@ -1,3 +1,7 @@
+import heapq
+import itertools
+import math
+import time
 from abc import ABCMeta, abstractmethod
 from collections import deque
 from enum import Enum
@@ -12,7 +16,7 @@ class Rank(Enum):
 
 class Employee(metaclass=ABCMeta):
 
-    def __init__(self, employee_id, name, rank, call_center):
+    def __init__(self, employee_id, name, rank, call_center=None):
         self.employee_id = employee_id
         self.name = name
         self.rank = rank
@@ -27,7 +31,9 @@ class Employee(metaclass=ABCMeta):
 
     def complete_call(self):
         self.call.state = CallState.COMPLETE
-        self.call_center.notify_call_completed(self.call)
+        call = self.call
+        self.call = None
+        self.call_center.notify_call_completed(call)
 
     @abstractmethod
     def escalate_call(self):
@@ -42,28 +48,28 @@ class Employee(metaclass=ABCMeta):
 
 class Operator(Employee):
 
-    def __init__(self, employee_id, name):
-        super(Operator, self).__init__(employee_id, name, Rank.OPERATOR)
+    def __init__(self, employee_id, name, call_center=None):
+        super(Operator, self).__init__(employee_id, name, Rank.OPERATOR, call_center)
 
     def escalate_call(self):
-        self.call.level = Rank.SUPERVISOR
+        self.call.rank = Rank.SUPERVISOR
         self._escalate_call()
 
 
 class Supervisor(Employee):
 
-    def __init__(self, employee_id, name):
-        super(Operator, self).__init__(employee_id, name, Rank.SUPERVISOR)
+    def __init__(self, employee_id, name, call_center=None):
+        super(Supervisor, self).__init__(employee_id, name, Rank.SUPERVISOR, call_center)
 
     def escalate_call(self):
-        self.call.level = Rank.DIRECTOR
+        self.call.rank = Rank.DIRECTOR
         self._escalate_call()
 
 
 class Director(Employee):
 
-    def __init__(self, employee_id, name):
-        super(Operator, self).__init__(employee_id, name, Rank.DIRECTOR)
+    def __init__(self, employee_id, name, call_center=None):
+        super(Director, self).__init__(employee_id, name, Rank.DIRECTOR, call_center)
 
     def escalate_call(self):
         raise NotImplementedError('Directors must be able to handle any call')
@@ -74,49 +80,134 @@ class CallState(Enum):
     READY = 0
     IN_PROGRESS = 1
     COMPLETE = 2
+    DROPPED = 3
 
 
 class Call(object):
 
-    def __init__(self, rank):
+    def __init__(self, rank, priority=0):
         self.state = CallState.READY
         self.rank = rank
+        self.priority = priority  # higher is more urgent
         self.employee = None
+        self.queued_at = None
 
 
 class CallCenter(object):
+    """Dispatches calls to free employees, queueing them when none are free.
+
+    Queued calls wait in a heap per rank ordered by priority plus aging_rate
+    for every second waited.  Aging grows every waiting call's priority at
+    the same rate, so the order is fixed when a call is queued: key
+    aging_rate * queued_at - priority, smallest first.  The most recent
+    wait_window queue waits per call rank are kept for percentiles.
+    """
 
-    def __init__(self, operators, supervisors, directors):
+    def __init__(self, operators, supervisors, directors, aging_rate=1.0 / 60,
+                 clock=time.monotonic, wait_window=100000):
         self.operators = operators
         self.supervisors = supervisors
         self.directors = directors
-        self.queued_calls = deque()
+        self.aging_rate = aging_rate
+        self.clock = clock
+        self.queued_calls = {rank: [] for rank in Rank}
+        self.queue_sequence = itertools.count()
+        self.queue_waits = {rank: deque(maxlen=wait_window) for rank in Rank}
+        # Free employees by rank.  An employee can be left in its pool after
+        # taking a call elsewhere, so entries are checked when popped.
+        self.free_employees = {rank: deque() for rank in Rank}
+        for employee in operators + supervisors + directors:
+            employee.call_center = self
+            if employee.call is None:
+                self.free_employees[employee.rank].append(employee)
+        # A call can be taken by its own rank or, if all are busy, a higher
+        # one; likewise an employee can take queued calls of lower ranks
+        self.pools_for_call = {
+            rank: [self.free_employees[other] for other in Rank if other.value >= rank.value]
+            for rank in Rank}
+        self.lower_queues = {
+            rank: [self.queued_calls[other] for other in Rank if other.value < rank.value]
+            for rank in Rank}
 
     def dispatch_call(self, call):
-        if call.rank not in (Rank.OPERATOR, Rank.SUPERVISOR, Rank.DIRECTOR):
+        if call.rank not in self.pools_for_call:
             raise ValueError('Invalid call rank: {}'.format(call.rank))
-        employee = None
-        if call.rank == Rank.OPERATOR:
-            employee = self._dispatch_call(call, self.operators)
-        if call.rank == Rank.SUPERVISOR or employee is None:
-            employee = self._dispatch_call(call, self.supervisors)
-        if call.rank == Rank.DIRECTOR or employee is None:
-            employee = self._dispatch_call(call, self.directors)
-        if employee is None:
-            self.queued_calls.append(call)
-
-    def _dispatch_call(self, call, employees):
-        for employee in employees:
+        for free_employees in self.pools_for_call[call.rank]:
+            employee = self._dispatch_call(call, free_employees)
+            if employee is not None:
+                self._record_wait(call)
+                return employee
+        self._queue_call(call)
+        return None
+
+    def _dispatch_call(self, call, free_employees):
+        while free_employees:
+            employee = free_employees.popleft()
             if employee.call is None:
                 employee.take_call(call)
                 return employee
         return None
 
+    def _free_employee(self, employee):
+        if employee.call is None:
+            self.free_employees[employee.rank].append(employee)
+
+    def _queue_call(self, call):
+        call.queued_at = self.clock()
+        key = self.aging_rate * call.queued_at - call.priority
+        heapq.heappush(self.queued_calls[call.rank], (key, next(self.queue_sequence), call))
+
+    def _pop_queued_call(self, rank):
+        """Pop the best call an employee of rank can take: its own rank's
+        first, since only it and higher ranks can take those, then the best
+        of the lower ranks' queue heads.
+        """
+        queue = self.queued_calls[rank]
+        if not queue:
+            lower_queues = [lower_queue for lower_queue in self.lower_queues[rank] if lower_queue]
+            if not lower_queues:
+                return None
+            queue = min(lower_queues, key=lambda lower_queue: lower_queue[0][:2])
+        return heapq.heappop(queue)[2]
+
+    def _record_wait(self, call):
+        wait = 0.0 if call.queued_at is None else self.clock() - call.queued_at
+        call.queued_at = None
+        self.queue_waits[call.rank].append(wait)
+
     def notify_call_escalated(self, call):
-        pass
+        employee = call.employee
+        call.employee = None
+        self.dispatch_queued_call_to_newly_freed_employee(call, employee)
+        self.dispatch_call(call)
 
     def notify_call_completed(self, call):
-        pass
+        self.dispatch_queued_call_to_newly_freed_employee(call, call.employee)
 
     def dispatch_queued_call_to_newly_freed_employee(self, call, employee):
-        pass
+        """Give the employee freed from call the best queued call it can
+        take, or return it to its free pool.
+        """
+        queued_call = self._pop_queued_call(employee.rank)
+        if queued_call is None:
+            self._free_employee(employee)
+            return None
+        self._record_wait(queued_call)
+        employee.take_call(queued_call)
+        return queued_call
+
+    def num_queued_calls(self):
+        return sum(len(queue) for queue in self.queued_calls.values())
+
+    def queue_wait_percentiles(self, percentiles=(50, 90, 99)):
+        """Nearest-rank percentiles of recent queue waits in seconds, by call
+        rank; calls dispatched without queueing count as zero waits.
+        """
+        result = {}
+        for rank, waits in self.queue_waits.items():
+            ordered = sorted(waits)
+            result[rank] = {
+                percentile: ordered[max(0, math.ceil(len(ordered) * percentile / 100) - 1)]
+                if ordered else None
+                for percentile in percentiles}
+        return result
@@ -0,0 +1,186 @@
+# Running instructions (from the repository root):
+#   python -m solutions.object_oriented_design.call_center.call_center_benchmark [num_calls]
+#   python -m solutions.object_oriented_design.call_center.call_center_benchmark async
+#   python -m solutions.object_oriented_design.call_center.call_center_benchmark simulate
+
+import asyncio
+import random
+import sys
+import time
+
+from solutions.object_oriented_design.call_center.async_call_center import AsyncCallCenter
+from solutions.object_oriented_design.call_center.call_center import \
+    Call, CallCenter, Director, Operator, Rank, Supervisor
+from solutions.object_oriented_design.call_center.call_center_simulation import sweep_staffing
+
+
+class ScanningCallCenter(CallCenter):
+    """Baseline: scan every employee of a rank for a free one."""
+
+    def dispatch_call(self, call):
+        employees_by_rank = (self.operators, self.supervisors, self.directors)
+        for rank in Rank:
+            if rank.value >= call.rank.value:
+                for employee in employees_by_rank[rank.value]:
+                    if employee.call is None:
+                        employee.take_call(call)
+                        self._record_wait(call)
+                        return employee
+        self._queue_call(call)
+        return None
+
+    def _free_employee(self, employee):
+        pass
+
+
+def build_center(call_center_class, num_agents, **kwargs):
+    num_directors = num_agents // 20
+    num_supervisors = num_agents * 3 // 20
+    num_operators = num_agents - num_supervisors - num_directors
+    return call_center_class(
+        [Operator(i, 'operator') for i in range(num_operators)],
+        [Supervisor(i, 'supervisor') for i in range(num_supervisors)],
+        [Director(i, 'director') for i in range(num_directors)],
+        **kwargs)
+
+
+def run(call_center, num_calls, busy_fraction=0.9, escalation_rate=0.05, seed=0):
+    """Fill busy_fraction of the agents with calls, then time num_calls
+    steps of: dispatch a new call, then complete or escalate random calls
+    in progress until fewer than busy_fraction of the agents are busy.
+    """
+    rng = random.Random(seed)
+    num_agents = len(call_center.operators) + len(call_center.supervisors) + \
+        len(call_center.directors)
+    target = int(num_agents * busy_fraction)
+    ranks = [Rank.OPERATOR] * 17 + [Rank.SUPERVISOR] * 2 + [Rank.DIRECTOR]
+    in_progress = []
+    while len(in_progress) < target:
+        employee = call_center.dispatch_call(Call(Rank.OPERATOR))
+        in_progress.append(employee)
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        employee = call_center.dispatch_call(Call(rng.choice(ranks)))
+        if employee is not None:
+            in_progress.append(employee)
+        while len(in_progress) >= target:
+            index = rng.randrange(len(in_progress))
+            in_progress[index], in_progress[-1] = in_progress[-1], in_progress[index]
+            employee = in_progress.pop()
+            if employee.rank != Rank.DIRECTOR and rng.random() < escalation_rate:
+                call = employee.call
+                employee.escalate_call()
+                if call.employee is not None:
+                    in_progress.append(call.employee)
+            else:
+                employee.complete_call()
+            if employee.call is not None:
+                # it picked up a queued call
+                in_progress.append(employee)
+    return num_calls / (time.perf_counter() - start)
+
+
+def main(num_calls=1000000, num_agents=10000):
+    baseline_calls = max(1, num_calls // 100)
+    print('%d agents, calls/sec' % num_agents)
+    print('%6s %28s %28s' % ('busy', 'scanning (%d calls)' % baseline_calls,
+                             'free pools (%d calls)' % num_calls))
+    for busy_fraction in (0.5, 0.9, 0.99):
+        scanning = run(build_center(ScanningCallCenter, num_agents), baseline_calls, busy_fraction)
+        pools = run(build_center(CallCenter, num_agents), num_calls, busy_fraction)
+        print('%5.0f%% %28.0f %28.0f' % (busy_fraction * 100, scanning, pools))
+
+
+def random_call(rng):
+    return Call(rng.choice((Rank.OPERATOR,) * 17 + (Rank.SUPERVISOR,) * 2 + (Rank.DIRECTOR,)))
+
+
+def report(name, center, seconds):
+    stats = center.stats()
+    waits = center.queue_wait_percentiles()[Rank.OPERATOR]
+    print('%-14s %6.1f s %8d %8d %8d %10d %8.0f %7.2f %7.2f' % (
+        name, seconds, stats['completed'], stats['rejected'], stats['dropped'],
+        stats['max_active'], stats['completed'] / seconds, waits[50], waits[99]))
+
+
+async def burst(num_agents, num_calls, mean_service_time):
+    """Admit num_calls at once and wait for all of them to finish."""
+    center = build_center(AsyncCallCenter, num_agents, max_queued=num_calls,
+                          mean_service_time=mean_service_time,
+                          escalation_probability=0.05, seed=0)
+    rng = random.Random(0)
+    center.start()
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        center.dispatch_call(random_call(rng))
+    await center.join()
+    report('burst', center, time.perf_counter() - start)
+    await center.stop()
+
+
+async def overload(num_agents, arrival_rate, duration, mean_service_time, max_queued, shed):
+    """Offer arrival_rate calls per second for duration seconds."""
+    center = build_center(AsyncCallCenter, num_agents, max_queued=max_queued, shed=shed,
+                          mean_service_time=mean_service_time,
+                          escalation_probability=0.05, seed=0)
+    rng = random.Random(0)
+    center.start()
+    start = last = time.perf_counter()
+    offered = 0.0
+    while last - start < duration:
+        await asyncio.sleep(0.01)
+        now = time.perf_counter()
+        offered += arrival_rate * (now - last)
+        last = now
+        while offered >= 1:
+            center.dispatch_call(random_call(rng))
+            offered -= 1
+    await center.join()
+    report('shed' if shed else 'reject', center, time.perf_counter() - start)
+    await center.stop()
+
+
+def main_async(num_agents=10000, mean_service_time=0.5):
+    capacity = num_agents / mean_service_time
+    print('%d agents, mean service %.1f s (capacity %.0f calls/s), waits in s' % (
+        num_agents, mean_service_time, capacity))
+    print('%-14s %8s %8s %8s %8s %10s %8s %7s %7s' % (
+        'scenario', 'wall', 'done', 'rejected', 'dropped', 'max active', 'done/s',
+        'p50', 'p99'))
+    asyncio.run(burst(num_agents, 100000, mean_service_time))
+    for shed in (False, True):
+        asyncio.run(overload(num_agents, 2 * capacity, 3.0, mean_service_time,
+                             max_queued=int(capacity), shed=shed))
+
+
+def main_simulate(arrival_rate=4.0):
+    """Sweep operator staffing for a day of arrival_rate calls per second.
+
+    With the default mix and service times the offered load is about 816
+    operators, 311 supervisors and 142 directors busy on average.
+    """
+    print('one simulated day at %.1f calls/s, waits in s' % arrival_rate)
+    print('%5s %5s %5s %8s %7s %7s %7s %8s %8s %6s %6s %6s %5s' % (
+        'ops', 'sups', 'dirs', 'calls', 'op p50', 'op p90', 'op p99', 'sup p99', 'dir p99',
+        'u ops', 'u sups', 'u dirs', 'sec'))
+    staffing_levels = [(num_operators, 330, 155) for num_operators in (820, 830, 840, 860, 900)]
+    start = time.perf_counter()
+    for staffing, results in sweep_staffing(staffing_levels, arrival_rate):
+        waits = results['wait_percentiles']
+        utilization = results['utilization']
+        print('%5d %5d %5d %8d %7.1f %7.1f %7.1f %8.1f %8.1f %6.2f %6.2f %6.2f %5.1f' % (
+            staffing + (results['calls'], waits[Rank.OPERATOR][50], waits[Rank.OPERATOR][90],
+                        waits[Rank.OPERATOR][99], waits[Rank.SUPERVISOR][99],
+                        waits[Rank.DIRECTOR][99], utilization[Rank.OPERATOR],
+                        utilization[Rank.SUPERVISOR], utilization[Rank.DIRECTOR],
+                        time.perf_counter() - start)))
+        start = time.perf_counter()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['async']:
+        main_async()
+    elif sys.argv[1:] == ['simulate']:
+        main_simulate()
+    else:
+        main(*[int(arg) for arg in sys.argv[1:]])
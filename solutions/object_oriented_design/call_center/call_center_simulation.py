@@ -0,0 +1,111 @@
+import heapq
+import itertools
+import random
+
+from solutions.object_oriented_design.call_center.call_center import \
+    Call, CallCenter, Director, Operator, Rank, Supervisor
+
+
+class CallCenterSimulation(object):
+    """Discrete-event simulation of a CallCenter on a virtual clock.
+
+    Calls arrive as a Poisson process at arrival_rate per second with ranks
+    drawn from rank_weights, until duration seconds have passed; the run
+    then continues until every call is finished.  An employee holds a call
+    for service_time(rng, rank) seconds, exponential with mean
+    mean_service_times[rank] by default, and then escalates it with
+    escalation_probabilities[rank] or completes it.  Dispatch, queueing and
+    queue waits are the CallCenter's own, reading the simulated time.
+    """
+
+    def __init__(self, num_operators, num_supervisors, num_directors, arrival_rate,
+                 rank_weights=None, mean_service_times=None, service_time=None,
+                 escalation_probabilities=None, aging_rate=1.0 / 60, seed=0):
+        self.staff = {Rank.OPERATOR: num_operators, Rank.SUPERVISOR: num_supervisors,
+                      Rank.DIRECTOR: num_directors}
+        self.arrival_rate = arrival_rate
+        self.rank_weights = rank_weights or \
+            {Rank.OPERATOR: 0.85, Rank.SUPERVISOR: 0.1, Rank.DIRECTOR: 0.05}
+        self.mean_service_times = mean_service_times or \
+            {Rank.OPERATOR: 240.0, Rank.SUPERVISOR: 420.0, Rank.DIRECTOR: 600.0}
+        self.service_time = service_time or \
+            (lambda rng, rank: rng.expovariate(1.0 / self.mean_service_times[rank]))
+        self.escalation_probabilities = escalation_probabilities or \
+            {Rank.OPERATOR: 0.1, Rank.SUPERVISOR: 0.05, Rank.DIRECTOR: 0.0}
+        self.aging_rate = aging_rate
+        self.seed = seed
+
+    def run(self, duration=24 * 60 * 60):
+        """Simulate duration seconds of arrivals and return the results."""
+        self.rng = random.Random(self.seed)
+        self.now = 0.0
+        self.duration = duration
+        self.events = []  # (time, sequence, handler, argument)
+        self.event_sequence = itertools.count()
+        self.call_ranks = list(self.rank_weights)
+        self.call_rank_weights = list(itertools.accumulate(self.rank_weights.values()))
+        self.busy_time = {rank: 0.0 for rank in Rank}
+        self.num_calls = 0
+        self.num_completed = 0
+        self.num_escalated = 0
+        self.center = CallCenter(
+            [Operator(i, 'operator') for i in range(self.staff[Rank.OPERATOR])],
+            [Supervisor(i, 'supervisor') for i in range(self.staff[Rank.SUPERVISOR])],
+            [Director(i, 'director') for i in range(self.staff[Rank.DIRECTOR])],
+            aging_rate=self.aging_rate, clock=lambda: self.now, wait_window=None)
+        self._schedule(self.rng.expovariate(self.arrival_rate), self._arrive, None)
+        events = self.events
+        while events:
+            self.now, _, handler, argument = heapq.heappop(events)
+            handler(argument)
+        return self._results()
+
+    def _schedule(self, time, handler, argument):
+        heapq.heappush(self.events, (time, next(self.event_sequence), handler, argument))
+
+    def _arrive(self, _):
+        next_arrival = self.now + self.rng.expovariate(self.arrival_rate)
+        if next_arrival < self.duration:
+            self._schedule(next_arrival, self._arrive, None)
+        rank = self.rng.choices(self.call_ranks, cum_weights=self.call_rank_weights)[0]
+        self.num_calls += 1
+        employee = self.center.dispatch_call(Call(rank))
+        if employee is not None:
+            self._start(employee)
+
+    def _start(self, employee):
+        service_time = self.service_time(self.rng, employee.rank)
+        self.busy_time[employee.rank] += service_time
+        self._schedule(self.now + service_time, self._finish, employee)
+
+    def _finish(self, employee):
+        call = employee.call
+        if self.rng.random() < self.escalation_probabilities[employee.rank] and \
+                employee.rank != Rank.DIRECTOR:
+            self.num_escalated += 1
+            employee.escalate_call()
+            if call.employee is not None:
+                self._start(call.employee)
+        else:
+            self.num_completed += 1
+            employee.complete_call()
+        # a freed employee may have been handed a queued call
+        if employee.call is not None:
+            self._start(employee)
+
+    def _results(self):
+        utilization = {}
+        for rank, num_staff in self.staff.items():
+            capacity = num_staff * self.now
+            utilization[rank] = self.busy_time[rank] / capacity if capacity else 0.0
+        return {'calls': self.num_calls, 'completed': self.num_completed,
+                'escalated': self.num_escalated, 'end_time': self.now,
+                'wait_percentiles': self.center.queue_wait_percentiles(),
+                'utilization': utilization}
+
+
+def sweep_staffing(staffing_levels, arrival_rate, duration=24 * 60 * 60, **kwargs):
+    """Yield (staffing, results) for each (operators, supervisors, directors)."""
+    for staffing in staffing_levels:
+        simulation = CallCenterSimulation(*staffing, arrival_rate=arrival_rate, **kwargs)
+        yield staffing, simulation.run(duration)
@@ -1,3 +1,31 @@
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+from array import array
+from threading import Lock
+
+
+FROZEN_HEADER = struct.Struct('<4sQQ')  # magic, number of slots, number of items
+FROZEN_SLOT = struct.Struct('<QQ')  # stable key hash, record offset (0 when empty)
+FROZEN_RECORD = struct.Struct('<II')  # pickled key length, pickled value length
+FROZEN_MAGIC = b'HTF1'
+
+
+def stable_hash(key):
+    """64-bit hash of a key that is the same in every process.
+
+    hash() is salted per process for str and bytes; keys should be plain
+    values (ints, strs, tuples) so that equal keys pickle identically.
+    """
+    return _digest(pickle.dumps(key, protocol=4))
+
+
+def _digest(key_bytes):
+    return int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'big')
+
+
 class Item(object):
 
     def __init__(self, key, value):
@@ -36,3 +64,426 @@ class HashTable(object):
                 del self.table[hash_index][index]
                 return
         raise KeyError('Key not found')
+
+    def items(self):
+        for bucket in self.table:
+            for item in bucket:
+                yield item.key, item.value
+
+    def freeze(self, path):
+        FrozenHashTable.write(self.items(), path)
+
+
+class ProbeTable(object):
+
+    __slots__ = ('hashes', 'keys', 'values', 'mask', 'max_distance')
+
+    def __init__(self, capacity):
+        self.hashes = array('q', [OpenAddressingHashTable.EMPTY]) * capacity
+        self.keys = [None] * capacity
+        self.values = [None] * capacity
+        self.mask = capacity - 1
+        self.max_distance = 0
+
+
+class OpenAddressingHashTable(object):
+    """Robin Hood hash table over parallel arrays, for any hashable key.
+
+    Slot i holds hashes[i], keys[i] and values[i]; EMPTY marks a free slot.
+    hash() is scrambled before use because linear probing degrades badly
+    on the clustered hashes of consecutive ints.  Removal shifts the
+    following entries back instead of leaving tombstones.
+
+    When the load factor passes MAX_LOAD_FACTOR a table twice the size is
+    allocated and every later operation moves MIGRATION_BATCH slots of the
+    old table into it, so no single call pays for the whole resize.
+    """
+
+    EMPTY = -1
+    MAX_LOAD_FACTOR = 0.7
+    MIGRATION_BATCH = 16
+
+    def __init__(self, size=8):
+        capacity = 8
+        while capacity < size:
+            capacity <<= 1
+        self.size = 0
+        self.table = ProbeTable(capacity)
+        self.old_table = None  # set while a resize is in progress
+        self.migrate_index = 0
+
+    def __len__(self):
+        return self.size
+
+    def _hash_function(self, key):
+        """Mix hash(key) into a non-negative 63-bit value."""
+        key_hash = (hash(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return (key_hash ^ (key_hash >> 32)) & 0x7FFFFFFFFFFFFFFF
+
+    def set(self, key, value):
+        self._migrate()
+        key_hash = self._hash_function(key)
+        index = self._find(self.table, key_hash, key)
+        if index >= 0:
+            self.table.values[index] = value
+            return
+        if self.old_table is not None:
+            index = self._find_in_old_table(key_hash, key)
+            if index >= 0:
+                self._remove_at(self.old_table, index)
+                self.size -= 1
+        elif self.size + 1 > self.MAX_LOAD_FACTOR * (self.table.mask + 1):
+            self._start_resize()
+        self._insert(self.table, key_hash, key, value)
+        self.size += 1
+
+    def get(self, key):
+        self._migrate()
+        key_hash = self._hash_function(key)
+        index = self._find(self.table, key_hash, key)
+        if index >= 0:
+            return self.table.values[index]
+        if self.old_table is not None:
+            index = self._find_in_old_table(key_hash, key)
+            if index >= 0:
+                return self.old_table.values[index]
+        raise KeyError('Key not found')
+
+    def remove(self, key):
+        self._migrate()
+        key_hash = self._hash_function(key)
+        table = self.table
+        index = self._find(table, key_hash, key)
+        if index < 0 and self.old_table is not None:
+            table = self.old_table
+            index = self._find_in_old_table(key_hash, key)
+        if index < 0:
+            raise KeyError('Key not found')
+        self._remove_at(table, index)
+        self.size -= 1
+
+    def items(self):
+        """Yield every (key, value) pair, including those of a table that
+        is still being migrated.
+        """
+        for table in (self.old_table, self.table):
+            if table is None:
+                continue
+            for index, slot_hash in enumerate(table.hashes):
+                if slot_hash != self.EMPTY:
+                    yield table.keys[index], table.values[index]
+
+    def freeze(self, path):
+        FrozenHashTable.write(self.items(), path)
+
+    def _find(self, table, key_hash, key):
+        hashes = table.hashes
+        keys = table.keys
+        mask = table.mask
+        index = key_hash & mask
+        distance = 0
+        while True:
+            slot_hash = hashes[index]
+            if slot_hash == self.EMPTY:
+                return -1
+            # Robin Hood invariant: the key would have displaced this entry
+            if (index - slot_hash) & mask < distance:
+                return -1
+            if slot_hash == key_hash and (keys[index] is key or keys[index] == key):
+                return index
+            index = (index + 1) & mask
+            distance += 1
+
+    def _find_in_old_table(self, key_hash, key):
+        """Probe the table being migrated.
+
+        Slots below migrate_index have been emptied by the migration, so they
+        cannot end a probe; the search is bounded by the longest probe the
+        old table ever needed.
+        """
+        table = self.old_table
+        hashes = table.hashes
+        keys = table.keys
+        mask = table.mask
+        index = key_hash & mask
+        for distance in range(table.max_distance + 1):
+            slot_hash = hashes[index]
+            if slot_hash == self.EMPTY:
+                if index >= self.migrate_index:
+                    return -1
+            elif (index - slot_hash) & mask < distance:
+                return -1
+            elif slot_hash == key_hash and (keys[index] is key or keys[index] == key):
+                return index
+            index = (index + 1) & mask
+        return -1
+
+    def _insert(self, table, key_hash, key, value):
+        hashes = table.hashes
+        keys = table.keys
+        values = table.values
+        mask = table.mask
+        index = key_hash & mask
+        distance = 0
+        while True:
+            slot_hash = hashes[index]
+            if slot_hash == self.EMPTY:
+                hashes[index] = key_hash
+                keys[index] = key
+                values[index] = value
+                if distance > table.max_distance:
+                    table.max_distance = distance
+                return
+            slot_distance = (index - slot_hash) & mask
+            if slot_distance < distance:
+                # Take the slot from the entry closer to home, carry it on
+                hashes[index], key_hash = key_hash, slot_hash
+                keys[index], key = key, keys[index]
+                values[index], value = value, values[index]
+                if distance > table.max_distance:
+                    table.max_distance = distance
+                distance = slot_distance
+            index = (index + 1) & mask
+            distance += 1
+
+    def _remove_at(self, table, index):
+        hashes = table.hashes
+        keys = table.keys
+        values = table.values
+        mask = table.mask
+        next_index = (index + 1) & mask
+        while hashes[next_index] != self.EMPTY and (next_index - hashes[next_index]) & mask != 0:
+            hashes[index] = hashes[next_index]
+            keys[index] = keys[next_index]
+            values[index] = values[next_index]
+            index = next_index
+            next_index = (next_index + 1) & mask
+        hashes[index] = self.EMPTY
+        keys[index] = None
+        values[index] = None
+
+    def _start_resize(self):
+        self.old_table = self.table
+        self.table = ProbeTable(2 * (self.old_table.mask + 1))
+        self.migrate_index = 0
+
+    def _migrate(self):
+        """Move the next MIGRATION_BATCH slots of the old table, if any."""
+        old_table = self.old_table
+        if old_table is None:
+            return
+        hashes = old_table.hashes
+        keys = old_table.keys
+        values = old_table.values
+        end = min(self.migrate_index + self.MIGRATION_BATCH, old_table.mask + 1)
+        for index in range(self.migrate_index, end):
+            if hashes[index] != self.EMPTY:
+                self._insert(self.table, hashes[index], keys[index], values[index])
+                hashes[index] = self.EMPTY
+                keys[index] = None
+                values[index] = None
+        self.migrate_index = end
+        if end == old_table.mask + 1:
+            self.old_table = None
+
+
+class StripedTable(object):
+
+    def __init__(self, num_buckets):
+        self.buckets = [()] * num_buckets  # each bucket: tuple of (hash, key, value)
+        self.next = None  # the table buckets are forwarded to during a resize
+
+
+class ConcurrentHashTable(object):
+    """Chained hash table that threads can share without a global lock.
+
+    Writers lock one of num_stripes stripes; bucket i always belongs to
+    stripe i % num_stripes because the bucket count stays a multiple of
+    num_stripes.  Buckets are immutable tuples replaced on every write, so
+    readers take no lock and always see a whole bucket.
+
+    A resize migrates one stripe at a time under that stripe's lock and
+    replaces each migrated bucket with FORWARDED, which sends readers and
+    writers on to the new table.  Other stripes stay usable throughout.
+    """
+
+    FORWARDED = None
+    MAX_LOAD_FACTOR = 2.0
+
+    def __init__(self, num_stripes=16, size=None):
+        self.num_stripes = num_stripes
+        num_buckets = num_stripes
+        while size is not None and num_buckets < size:
+            num_buckets <<= 1
+        self.table = StripedTable(num_buckets)
+        self.locks = [Lock() for _ in range(num_stripes)]
+        self.counts = [0] * num_stripes
+        self.resize_lock = Lock()
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def get(self, key):
+        key_hash = hash(key)
+        table = self.table
+        while True:
+            bucket = table.buckets[key_hash % len(table.buckets)]
+            if bucket is not self.FORWARDED:
+                break
+            table = table.next
+        for item_hash, item_key, value in bucket:
+            if item_hash == key_hash and (item_key is key or item_key == key):
+                return value
+        raise KeyError('Key not found')
+
+    def set(self, key, value):
+        key_hash = hash(key)
+        stripe = key_hash % self.num_stripes
+        with self.locks[stripe]:
+            table, index = self._locate(key_hash)
+            bucket = table.buckets[index]
+            for position, (item_hash, item_key, _) in enumerate(bucket):
+                if item_hash == key_hash and (item_key is key or item_key == key):
+                    table.buckets[index] = \
+                        bucket[:position] + ((key_hash, key, value),) + bucket[position + 1:]
+                    return
+            table.buckets[index] = bucket + ((key_hash, key, value),)
+            self.counts[stripe] += 1
+        if len(self) > self.MAX_LOAD_FACTOR * len(self.table.buckets):
+            self._resize()
+
+    def remove(self, key):
+        key_hash = hash(key)
+        stripe = key_hash % self.num_stripes
+        with self.locks[stripe]:
+            table, index = self._locate(key_hash)
+            bucket = table.buckets[index]
+            for position, (item_hash, item_key, _) in enumerate(bucket):
+                if item_hash == key_hash and (item_key is key or item_key == key):
+                    table.buckets[index] = bucket[:position] + bucket[position + 1:]
+                    self.counts[stripe] -= 1
+                    return
+        raise KeyError('Key not found')
+
+    def _locate(self, key_hash):
+        """Return the table and bucket index that currently own key_hash.
+
+        Must be called with the key's stripe lock held.
+        """
+        table = self.table
+        while True:
+            index = key_hash % len(table.buckets)
+            if table.buckets[index] is not self.FORWARDED:
+                return table, index
+            table = table.next
+
+    def _resize(self):
+        # Only one thread resizes; the others carry on with their writes
+        if not self.resize_lock.acquire(blocking=False):
+            return
+        try:
+            old_table = self.table
+            num_buckets = len(old_table.buckets)
+            if len(self) <= self.MAX_LOAD_FACTOR * num_buckets:
+                return
+            new_table = StripedTable(2 * num_buckets)
+            old_table.next = new_table
+            for stripe in range(self.num_stripes):
+                with self.locks[stripe]:
+                    for index in range(stripe, num_buckets, self.num_stripes):
+                        for item in old_table.buckets[index]:
+                            new_index = item[0] % len(new_table.buckets)
+                            new_table.buckets[new_index] += (item,)
+                        old_table.buckets[index] = self.FORWARDED
+            self.table = new_table
+        finally:
+            self.resize_lock.release()
+
+
+class FrozenHashTable(object):
+    """Read-only hash table served straight from a memory-mapped file.
+
+    The file holds a linear-probing slot array of (stable hash, record
+    offset) followed by the pickled records.  Opening it maps the file
+    without reading it, lookups probe the mapped slots in place, and every
+    process that opens the same file shares its pages through the OS page
+    cache.  Only the value being returned is unpickled.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as frozen:
+            self.buffer = mmap.mmap(frozen.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.buffer)
+        magic, self.num_slots, self.size = FROZEN_HEADER.unpack_from(self.buffer, 0)
+        if magic != FROZEN_MAGIC:
+            raise ValueError('Not a frozen hash table: {}'.format(path))
+        self.mask = self.num_slots - 1
+
+    @staticmethod
+    def write(items, path):
+        """Write (key, value) pairs to path in the frozen format."""
+        records = [(pickle.dumps(key, protocol=4), pickle.dumps(value, protocol=4))
+                   for key, value in items]
+        num_slots = 8
+        while num_slots < 2 * len(records):
+            num_slots <<= 1
+        mask = num_slots - 1
+        slots = bytearray(num_slots * FROZEN_SLOT.size)
+        offset = FROZEN_HEADER.size + len(slots)
+        for key_bytes, value_bytes in records:
+            key_hash = _digest(key_bytes)
+            index = key_hash & mask
+            while FROZEN_SLOT.unpack_from(slots, index * FROZEN_SLOT.size)[1]:
+                index = (index + 1) & mask
+            FROZEN_SLOT.pack_into(slots, index * FROZEN_SLOT.size, key_hash, offset)
+            offset += FROZEN_RECORD.size + len(key_bytes) + len(value_bytes)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as frozen:
+            frozen.write(FROZEN_HEADER.pack(FROZEN_MAGIC, num_slots, len(records)))
+            frozen.write(slots)
+            for key_bytes, value_bytes in records:
+                frozen.write(FROZEN_RECORD.pack(len(key_bytes), len(value_bytes)))
+                frozen.write(key_bytes)
+                frozen.write(value_bytes)
+        os.replace(temp_path, path)
+
+    def __len__(self):
+        return self.size
+
+    def get(self, key):
+        key_bytes = pickle.dumps(key, protocol=4)
+        key_hash = _digest(key_bytes)
+        index = key_hash & self.mask
+        while True:
+            slot_hash, offset = FROZEN_SLOT.unpack_from(
+                self.buffer, FROZEN_HEADER.size + index * FROZEN_SLOT.size)
+            if not offset:
+                raise KeyError('Key not found')
+            if slot_hash == key_hash:
+                key_length, value_length = FROZEN_RECORD.unpack_from(self.buffer, offset)
+                key_start = offset + FROZEN_RECORD.size
+                value_start = key_start + key_length
+                # Compare against the mapped bytes without copying them
+                if self.view[key_start:value_start] == key_bytes:
+                    return pickle.loads(self.view[value_start:value_start + value_length])
+            index = (index + 1) & self.mask
+
+    def items(self):
+        offset = FROZEN_HEADER.size + self.num_slots * FROZEN_SLOT.size
+        for _ in range(self.size):
+            key_length, value_length = FROZEN_RECORD.unpack_from(self.buffer, offset)
+            key_start = offset + FROZEN_RECORD.size
+            value_start = key_start + key_length
+            yield (pickle.loads(self.view[key_start:value_start]),
+                   pickle.loads(self.view[value_start:value_start + value_length]))
+            offset = value_start + value_length
+
+    def set(self, key, value):
+        raise TypeError('FrozenHashTable is read-only')
+
+    def remove(self, key):
+        raise TypeError('FrozenHashTable is read-only')
+
+    def close(self):
+        self.view.release()
+        self.buffer.close()
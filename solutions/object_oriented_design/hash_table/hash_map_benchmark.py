@@ -0,0 +1,243 @@
+# Running instructions (from the repository root):
+#   python -m solutions.object_oriented_design.hash_table.hash_map_benchmark [num_keys]
+#   python -m solutions.object_oriented_design.hash_table.hash_map_benchmark concurrent
+#   python -m solutions.object_oriented_design.hash_table.hash_map_benchmark cluster
+#   python -m solutions.object_oriented_design.hash_table.hash_map_benchmark frozen
+
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from threading import Lock, Thread
+
+from solutions.object_oriented_design.hash_table.hash_map import \
+    ConcurrentHashTable, FrozenHashTable, HashTable, OpenAddressingHashTable
+from solutions.object_oriented_design.hash_table.hash_ring import HashTableCluster
+
+
+class DictTable(object):
+    """dict behind the HashTable interface, as the baseline."""
+
+    def __init__(self):
+        self.table = {}
+
+    def set(self, key, value):
+        self.table[key] = value
+
+    def get(self, key):
+        return self.table[key]
+
+    def remove(self, key):
+        del self.table[key]
+
+
+def ops_per_second(operation, keys):
+    start = time.perf_counter()
+    for key in keys:
+        operation(key)
+    return len(keys) / (time.perf_counter() - start)
+
+
+def main(num_keys=1000000):
+    keys = random.Random(0).sample(range(num_keys * 10), num_keys)
+    tables = (
+        ('chained (size n/4)', HashTable(max(1, num_keys // 4))),
+        ('open addressing', OpenAddressingHashTable()),
+        ('dict', DictTable()),
+    )
+    print('%d integer keys, ops/sec' % num_keys)
+    print('%-20s %12s %12s %12s' % ('', 'set', 'get', 'remove'))
+    for name, table in tables:
+        set_rate = ops_per_second(lambda key: table.set(key, key), keys)
+        get_rate = ops_per_second(table.get, keys)
+        remove_rate = ops_per_second(table.remove, keys)
+        print('%-20s %12.0f %12.0f %12.0f' % (name, set_rate, get_rate, remove_rate))
+
+
+class GlobalLockTable(object):
+    """Baseline: the chained HashTable behind one lock."""
+
+    def __init__(self, size):
+        self.table = HashTable(size)
+        self.lock = Lock()
+
+    def set(self, key, value):
+        with self.lock:
+            self.table.set(key, value)
+
+    def get(self, key):
+        with self.lock:
+            return self.table.get(key)
+
+    def remove(self, key):
+        with self.lock:
+            self.table.remove(key)
+
+
+def stress(table, num_writers=8, num_readers=4, ops_per_writer=50000):
+    """Writers own disjoint key ranges and mirror their writes in a dict;
+    readers check every value they see belongs to its key.  Afterwards the
+    table must match the writers' dicts exactly.
+    """
+    errors = []
+    expected = [{} for _ in range(num_writers)]
+    done = []
+
+    def writer(writer_id):
+        rng = random.Random(writer_id)
+        mirror = expected[writer_id]
+        for i in range(ops_per_writer):
+            key = writer_id * ops_per_writer + rng.randrange(ops_per_writer // 4)
+            if rng.random() < 0.7:
+                table.set(key, (key, i))
+                mirror[key] = (key, i)
+            elif key in mirror:
+                table.remove(key)
+                del mirror[key]
+
+    def reader(reader_id):
+        rng = random.Random(-reader_id)
+        while not done:
+            key = rng.randrange(num_writers * ops_per_writer)
+            try:
+                value = table.get(key)
+            except KeyError:
+                continue
+            if value[0] != key:
+                errors.append('key %r had value %r' % (key, value))
+
+    writers = [Thread(target=writer, args=(i,)) for i in range(num_writers)]
+    readers = [Thread(target=reader, args=(i,)) for i in range(num_readers)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.append(True)
+    for thread in readers:
+        thread.join()
+    for mirror in expected:
+        for key, value in mirror.items():
+            if table.get(key) != value:
+                errors.append('key %r lost its value %r' % (key, value))
+    if len(table) != sum(len(mirror) for mirror in expected):
+        errors.append('size %d does not match' % len(table))
+    return errors
+
+
+def mixed_workload(table, num_threads, read_ratio, ops_per_thread=50000, num_keys=100000):
+    for key in range(num_keys):
+        table.set(key, key)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(ops_per_thread):
+            key = rng.randrange(num_keys)
+            if rng.random() < read_ratio:
+                table.get(key)
+            else:
+                table.set(key, key)
+
+    threads = [Thread(target=worker, args=(i,)) for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return num_threads * ops_per_thread / (time.perf_counter() - start)
+
+
+def main_concurrent():
+    errors = stress(ConcurrentHashTable(size=16))
+    print('stress test: %s' % ('ok' if not errors else '; '.join(errors[:5])))
+    print('%-12s %8s %18s %18s' % ('mix', 'threads', 'global lock ops/s', 'striped ops/s'))
+    for name, read_ratio in (('read-heavy', 0.9), ('write-heavy', 0.1)):
+        for num_threads in (1, 4, 16):
+            global_lock = mixed_workload(GlobalLockTable(50000), num_threads, read_ratio)
+            striped = mixed_workload(ConcurrentHashTable(), num_threads, read_ratio)
+            print('%-12s %8d %18.0f %18.0f' % (name, num_threads, global_lock, striped))
+
+
+def main_cluster(num_keys=100000, max_nodes=8, num_ops=20000):
+    cluster = HashTableCluster(num_nodes=1)
+    keys = ['key-%d' % i for i in range(num_keys)]
+    for key in keys:
+        cluster.set(key, key)
+    print('%d keys' % num_keys)
+    print('%5s %10s %10s %9s %10s' % ('nodes', 'moved', 'moved %', 'ideal %', 'get ops/s'))
+    try:
+        for num_nodes in range(2, max_nodes + 1):
+            _, moved = cluster.add_node()
+            sample = random.Random(num_nodes).sample(keys, num_ops)
+            rate = ops_per_second(cluster.get, sample)
+            print('%5d %10d %10.1f %9.1f %10.0f' % (
+                num_nodes, moved, 100.0 * moved / num_keys, 100.0 / num_nodes, rate))
+        moved = cluster.remove_node(0)
+        print('removed node 0: %d keys moved (%.1f%%)' % (moved, 100.0 * moved / num_keys))
+        assert all(cluster.get(key) == key for key in keys)
+    finally:
+        cluster.shutdown()
+
+
+def source_items(num_keys):
+    for i in range(num_keys):
+        yield 'key-%d' % i, ('value', i)
+
+
+def rss_mb():
+    """Resident set size now; falls back to the peak where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2.0 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def start_live(num_keys, results):
+    baseline = rss_mb()
+    start = time.perf_counter()
+    table = OpenAddressingHashTable()
+    for key, value in source_items(num_keys):
+        table.set(key, value)
+    table.get('key-0')
+    results.put(('live table', time.perf_counter() - start, rss_mb() - baseline))
+
+
+def start_frozen(path, num_keys, results):
+    baseline = rss_mb()
+    start = time.perf_counter()
+    table = FrozenHashTable(path)
+    table.get('key-0')
+    elapsed = time.perf_counter() - start
+    rng = random.Random(0)
+    for _ in range(10000):
+        table.get('key-%d' % rng.randrange(num_keys))
+    results.put(('frozen (mmap)', elapsed, rss_mb() - baseline))
+
+
+def main_frozen(num_keys=1000000):
+    path = os.path.join(tempfile.mkdtemp(), 'table.htf')
+    FrozenHashTable.write(source_items(num_keys), path)
+    print('%d keys, frozen file %.1f MB' % (num_keys, os.path.getsize(path) / 2.0 ** 20))
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    for target, args in ((start_live, (num_keys, results)),
+                         (start_frozen, (path, num_keys, results))):
+        process = context.Process(target=target, args=args)
+        process.start()
+        name, seconds, rss = results.get()
+        process.join()
+        print('%-14s startup %9.1f ms, RSS growth %7.1f MB' % (name, seconds * 1000, rss))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['concurrent']:
+        main_concurrent()
+    elif sys.argv[1:] == ['cluster']:
+        main_cluster()
+    elif sys.argv[1:] == ['frozen']:
+        main_frozen()
+    else:
+        main(*[int(arg) for arg in sys.argv[1:]])
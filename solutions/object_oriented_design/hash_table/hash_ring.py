@@ -0,0 +1,154 @@
+import itertools
+from bisect import bisect_left, insort
+from multiprocessing import Pipe, Process
+
+from solutions.object_oriented_design.hash_table.hash_map import \
+    OpenAddressingHashTable, stable_hash as ring_hash
+
+
+class ConsistentHashRing(object):
+    """Maps keys to nodes; each node owns virtual_nodes points on the ring
+    and a key belongs to the node of the first point at or after its hash.
+    """
+
+    def __init__(self, virtual_nodes=100):
+        self.virtual_nodes = virtual_nodes
+        self.points = []  # sorted ring positions
+        self.point_to_node = {}
+
+    def add_node(self, node_id):
+        for replica in range(self.virtual_nodes):
+            point = ring_hash((node_id, replica))
+            self.point_to_node[point] = node_id
+            insort(self.points, point)
+
+    def remove_node(self, node_id):
+        for replica in range(self.virtual_nodes):
+            point = ring_hash((node_id, replica))
+            del self.point_to_node[point]
+            del self.points[bisect_left(self.points, point)]
+
+    def get_node(self, key):
+        return self.node_for_point(ring_hash(key))
+
+    def node_for_point(self, point):
+        if not self.points:
+            raise LookupError('The ring has no nodes')
+        index = bisect_left(self.points, point)
+        if index == len(self.points):
+            index = 0
+        return self.point_to_node[self.points[index]]
+
+
+def serve_shard(connection):
+    """Run one shard: apply (operation, *args) requests to a local table
+    and reply with ('ok', result) or ('error', exception).
+    """
+    table = OpenAddressingHashTable()
+    while True:
+        operation, *args = connection.recv()
+        try:
+            if operation == 'set':
+                result = table.set(*args)
+            elif operation == 'get':
+                result = table.get(*args)
+            elif operation == 'remove':
+                result = table.remove(*args)
+            elif operation == 'set_many':
+                for key, value in args[0]:
+                    table.set(key, value)
+                result = None
+            elif operation == 'extract':
+                result = extract_moved_items(table, *args)
+            elif operation == 'items':
+                result = list(table.items())
+            elif operation == 'stop':
+                connection.send(('ok', None))
+                return
+            else:
+                raise ValueError('Unknown operation: {}'.format(operation))
+        except Exception as e:
+            connection.send(('error', e))
+        else:
+            connection.send(('ok', result))
+
+
+def extract_moved_items(table, ring, node_id):
+    """Remove and return the items that ring assigns to other nodes."""
+    moved = [(key, value) for key, value in table.items() if ring.get_node(key) != node_id]
+    for key, _ in moved:
+        table.remove(key)
+    return moved
+
+
+class HashTableCluster(object):
+    """HashTable interface over shard processes routed by a consistent hash
+    ring.  Adding or removing a node moves only the keys whose ring owner
+    changed, about 1/N of them.
+    """
+
+    def __init__(self, num_nodes=1, virtual_nodes=100):
+        self.ring = ConsistentHashRing(virtual_nodes)
+        self.nodes = {}  # key: node id, value: (process, connection)
+        self.node_ids = itertools.count()
+        for _ in range(num_nodes):
+            self.add_node()
+
+    def _call(self, node_id, operation, *args):
+        connection = self.nodes[node_id][1]
+        connection.send((operation,) + args)
+        status, result = connection.recv()
+        if status == 'error':
+            raise result
+        return result
+
+    def set(self, key, value):
+        self._call(self.ring.get_node(key), 'set', key, value)
+
+    def get(self, key):
+        return self._call(self.ring.get_node(key), 'get', key)
+
+    def remove(self, key):
+        self._call(self.ring.get_node(key), 'remove', key)
+
+    def add_node(self):
+        """Start a shard, hand it its keys and return (node_id, keys moved)."""
+        node_id = next(self.node_ids)
+        connection, child_connection = Pipe()
+        process = Process(target=serve_shard, args=(child_connection,), daemon=True)
+        process.start()
+        existing_node_ids = list(self.nodes)
+        self.nodes[node_id] = (process, connection)
+        self.ring.add_node(node_id)
+        moved = []
+        for existing_node_id in existing_node_ids:
+            moved.extend(self._call(existing_node_id, 'extract', self.ring, existing_node_id))
+        if moved:
+            self._call(node_id, 'set_many', moved)
+        return node_id, len(moved)
+
+    def remove_node(self, node_id):
+        """Stop a shard after handing its keys to their new owners; return
+        the number of keys moved.
+        """
+        if len(self.nodes) == 1:
+            raise ValueError('Cannot remove the last node')
+        items = self._call(node_id, 'items')
+        self.ring.remove_node(node_id)
+        self._call(node_id, 'stop')
+        process, connection = self.nodes.pop(node_id)
+        process.join()
+        connection.close()
+        node_to_items = {}
+        for key, value in items:
+            node_to_items.setdefault(self.ring.get_node(key), []).append((key, value))
+        for owner, owner_items in node_to_items.items():
+            self._call(owner, 'set_many', owner_items)
+        return len(items)
+
+    def shutdown(self):
+        for node_id in list(self.nodes):
+            self._call(node_id, 'stop')
+            process, connection = self.nodes.pop(node_id)
+            process.join()
+            connection.close()
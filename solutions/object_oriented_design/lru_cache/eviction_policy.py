@@ -0,0 +1,282 @@
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+
+class EvictionPolicy(metaclass=ABCMeta):
+    """Decides which keys a Cache keeps.
+
+    The Cache stores the results and tells the policy about hits, inserts
+    and removals; the policy answers with the keys that must be evicted.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+
+    @abstractmethod
+    def access(self, key):
+        """Record a hit on a key that is in the cache."""
+        pass
+
+    @abstractmethod
+    def insert(self, key):
+        """Add a new key and return the list of keys to evict.
+
+        The list may contain key itself if the policy refuses to admit it.
+        """
+        pass
+
+    @abstractmethod
+    def evict(self):
+        """Choose a victim when the cache needs room for another reason."""
+        pass
+
+    @abstractmethod
+    def remove(self, key):
+        pass
+
+
+class LruPolicy(EvictionPolicy):
+
+    def __init__(self, capacity):
+        super(LruPolicy, self).__init__(capacity)
+        self.entries = OrderedDict()
+
+    def access(self, key):
+        self.entries.move_to_end(key)
+
+    def insert(self, key):
+        self.entries[key] = None
+        evicted = []
+        while len(self.entries) > self.capacity:
+            evicted.append(self.evict())
+        return evicted
+
+    def evict(self):
+        return self.entries.popitem(last=False)[0]
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+
+
+class CountMinSketch(object):
+    """Approximate access frequencies in 4-bit-style saturating counters.
+
+    Every sample_size increments all counters are halved, so the sketch
+    forgets keys that used to be popular.
+    """
+
+    SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+    MAX_COUNT = 15
+
+    def __init__(self, capacity):
+        width = 1
+        while width < 4 * capacity:
+            width <<= 1
+        self.mask = width - 1
+        self.tables = [bytearray(width) for _ in self.SEEDS]
+        self.sample_size = 10 * capacity
+        self.additions = 0
+
+    def _indexes(self, key):
+        h = hash(key)
+        return [((h ^ seed) * 0x9E3779B97F4A7C15 >> 29) & self.mask for seed in self.SEEDS]
+
+    def increment(self, key):
+        for table, index in zip(self.tables, self._indexes(key)):
+            if table[index] < self.MAX_COUNT:
+                table[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._reset()
+
+    def estimate(self, key):
+        return min(table[index] for table, index in zip(self.tables, self._indexes(key)))
+
+    def _reset(self):
+        self.additions //= 2
+        for table in self.tables:
+            table[:] = bytes(count >> 1 for count in table)
+
+
+class WTinyLfuPolicy(EvictionPolicy):
+    """Window TinyLFU: a small admission window LRU in front of a segmented
+    main LRU, guarded by a frequency sketch.
+
+    A key evicted from the window only enters the main region if it has
+    been seen more often than the main region's victim, so one-off queries
+    cannot flush out frequently used entries.
+    """
+
+    def __init__(self, capacity, window_ratio=0.01, protected_ratio=0.8):
+        super(WTinyLfuPolicy, self).__init__(capacity)
+        self.window_capacity = max(1, int(capacity * window_ratio))
+        self.main_capacity = max(1, capacity - self.window_capacity)
+        self.protected_capacity = max(1, int(self.main_capacity * protected_ratio))
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.sketch = CountMinSketch(capacity)
+
+    def access(self, key):
+        self.sketch.increment(key)
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+        elif key in self.probation:
+            del self.probation[key]
+            self.protected[key] = None
+            if len(self.protected) > self.protected_capacity:
+                demoted = self.protected.popitem(last=False)[0]
+                self.probation[demoted] = None
+
+    def insert(self, key):
+        self.sketch.increment(key)
+        self.window[key] = None
+        if len(self.window) <= self.window_capacity:
+            return []
+        candidate = self.window.popitem(last=False)[0]
+        if len(self.probation) + len(self.protected) < self.main_capacity:
+            self.probation[candidate] = None
+            return []
+        victims = self.probation if self.probation else self.protected
+        victim = next(iter(victims))
+        if self.sketch.estimate(candidate) > self.sketch.estimate(victim):
+            del victims[victim]
+            self.probation[candidate] = None
+            return [victim]
+        return [candidate]
+
+    def evict(self):
+        for segment in (self.probation, self.protected, self.window):
+            if segment:
+                return segment.popitem(last=False)[0]
+        return None
+
+    def remove(self, key):
+        for segment in (self.window, self.probation, self.protected):
+            if key in segment:
+                del segment[key]
+                return
+
+
+class TwoQueuePolicy(EvictionPolicy):
+    """Full 2Q: new keys go to a FIFO (a1_in); keys seen again after falling
+    out of it are remembered by a ghost FIFO (a1_out) and promoted to the
+    main LRU (am).
+    """
+
+    def __init__(self, capacity, in_ratio=0.25, out_ratio=0.5):
+        super(TwoQueuePolicy, self).__init__(capacity)
+        self.in_capacity = max(1, int(capacity * in_ratio))
+        self.out_capacity = max(1, int(capacity * out_ratio))
+        self.a1_in = OrderedDict()
+        self.a1_out = OrderedDict()  # ghost entries, keys only
+        self.am = OrderedDict()
+
+    def access(self, key):
+        if key in self.am:
+            self.am.move_to_end(key)
+
+    def insert(self, key):
+        if key in self.a1_out:
+            del self.a1_out[key]
+            self.am[key] = None
+        else:
+            self.a1_in[key] = None
+        evicted = []
+        while len(self.a1_in) + len(self.am) > self.capacity:
+            evicted.append(self.evict())
+        return evicted
+
+    def evict(self):
+        if len(self.a1_in) > self.in_capacity or not self.am:
+            key = self.a1_in.popitem(last=False)[0]
+            self.a1_out[key] = None
+            if len(self.a1_out) > self.out_capacity:
+                self.a1_out.popitem(last=False)
+            return key
+        return self.am.popitem(last=False)[0]
+
+    def remove(self, key):
+        self.a1_in.pop(key, None)
+        self.am.pop(key, None)
+
+
+class ArcPolicy(EvictionPolicy):
+    """Adaptive Replacement Cache.
+
+    t1 holds keys seen once recently, t2 keys seen at least twice; b1 and b2
+    are their ghost lists.  Hits in the ghosts move the target size p of t1
+    towards whichever list would have kept the key.
+    """
+
+    def __init__(self, capacity):
+        super(ArcPolicy, self).__init__(capacity)
+        self.p = 0
+        self.t1 = OrderedDict()
+        self.t2 = OrderedDict()
+        self.b1 = OrderedDict()
+        self.b2 = OrderedDict()
+
+    def access(self, key):
+        if key in self.t1:
+            del self.t1[key]
+            self.t2[key] = None
+        else:
+            self.t2.move_to_end(key)
+
+    def insert(self, key):
+        capacity = self.capacity
+        evicted = []
+        if key in self.b1:
+            self.p = min(capacity, self.p + max(len(self.b2) // len(self.b1), 1))
+            self._replace(key, evicted)
+            del self.b1[key]
+            self.t2[key] = None
+        elif key in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) // len(self.b2), 1))
+            self._replace(key, evicted)
+            del self.b2[key]
+            self.t2[key] = None
+        else:
+            l1 = len(self.t1) + len(self.b1)
+            total = l1 + len(self.t2) + len(self.b2)
+            if l1 >= capacity:
+                if len(self.t1) < capacity:
+                    self.b1.popitem(last=False)
+                    self._replace(key, evicted)
+                else:
+                    evicted.append(self.t1.popitem(last=False)[0])
+            elif total >= capacity:
+                if total >= 2 * capacity:
+                    self.b2.popitem(last=False)
+                self._replace(key, evicted)
+            self.t1[key] = None
+        return evicted
+
+    def _replace(self, key, evicted):
+        if len(self.t1) + len(self.t2) < self.capacity:
+            return
+        if self.t1 and (len(self.t1) > self.p or (key in self.b2 and len(self.t1) == self.p)):
+            victim = self.t1.popitem(last=False)[0]
+            self.b1[victim] = None
+        else:
+            victim = self.t2.popitem(last=False)[0]
+            self.b2[victim] = None
+        evicted.append(victim)
+
+    def evict(self):
+        if self.t1 and (len(self.t1) > self.p or not self.t2):
+            victim = self.t1.popitem(last=False)[0]
+            self.b1[victim] = None
+        elif self.t2:
+            victim = self.t2.popitem(last=False)[0]
+            self.b2[victim] = None
+        else:
+            return None
+        return victim
+
+    def remove(self, key):
+        self.t1.pop(key, None)
+        self.t2.pop(key, None)
@@ -1,8 +1,16 @@
+import sys
+
+
 class Node(object):
 
-    def __init__(self, results):
+    __slots__ = ('query', 'results', 'num_bytes', 'prev', 'next')
+
+    def __init__(self, query, results, num_bytes=0):
+        self.query = query
         self.results = results
-        self.next = next
+        self.num_bytes = num_bytes
+        self.prev = None
+        self.next = None
 
 
 class LinkedList(object):
@@ -12,20 +20,60 @@ class LinkedList(object):
         self.tail = None
 
     def move_to_front(self, node):
-        pass
+        if node is self.head:
+            return
+        self.remove(node)
+        self.append_to_front(node)
 
     def append_to_front(self, node):
-        pass
+        node.prev = None
+        node.next = self.head
+        if self.head is not None:
+            self.head.prev = node
+        self.head = node
+        if self.tail is None:
+            self.tail = node
 
     def remove_from_tail(self):
-        pass
+        node = self.tail
+        if node is not None:
+            self.remove(node)
+        return node
+
+    def remove(self, node):
+        if node.prev is not None:
+            node.prev.next = node.next
+        else:
+            self.head = node.next
+        if node.next is not None:
+            node.next.prev = node.prev
+        else:
+            self.tail = node.prev
+        node.prev = None
+        node.next = None
 
 
 class Cache(object):
 
-    def __init__(self, MAX_SIZE):
+    def __init__(self, MAX_SIZE, max_bytes=None, sizeof=sys.getsizeof, policy=None):
+        """Bound the cache by entry count, by total bytes of results, or both.
+
+        Pass MAX_SIZE=None to bound by max_bytes alone.  The size of each
+        entry is measured once, when it is set, with sizeof(results).
+
+        policy is an EvictionPolicy class from eviction_policy; it is built
+        with MAX_SIZE and replaces the LRU list, so it needs an entry count.
+        Without it the cache is a plain LRU.
+        """
+        if policy is not None and MAX_SIZE is None:
+            raise ValueError('An eviction policy needs MAX_SIZE; '
+                             'only the plain LRU can be bounded by max_bytes alone')
         self.MAX_SIZE = MAX_SIZE
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.policy = policy(MAX_SIZE) if policy is not None else None
         self.size = 0
+        self.num_bytes = 0
         self.lookup = {}  # key: query, value: node
         self.linked_list = LinkedList()
 
@@ -37,7 +85,7 @@ class Cache(object):
         node = self.lookup.get(query)
         if node is None:
             return None
-        self.linked_list.move_to_front(node)
+        self._touch(node)
         return node.results
 
     def set(self, results, query):
@@ -45,22 +93,68 @@ class Cache(object):
 
         When updating an entry, updates its position to the front of the LRU list.
         If the entry is new and the cache is at capacity, removes the oldest entry
-        before the new entry is added.
+        before the new entry is added.  Results larger than max_bytes on their
+        own are not cached.
         """
+        num_bytes = self.sizeof(results) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and num_bytes > self.max_bytes:
+            self.remove(query)
+            return
         node = self.lookup.get(query)
         if node is not None:
             # Key exists in cache, update the value
+            self.num_bytes += num_bytes - node.num_bytes
             node.results = results
-            self.linked_list.move_to_front(node)
+            node.num_bytes = num_bytes
+            self._touch(node)
+        elif self.policy is not None:
+            # Key does not exist in cache, the policy picks what to evict
+            self.lookup[query] = Node(query, results, num_bytes)
+            self.size += 1
+            self.num_bytes += num_bytes
+            for victim in self.policy.insert(query):
+                self._remove_node(self.lookup.pop(victim))
         else:
             # Key does not exist in cache
             if self.size == self.MAX_SIZE:
                 # Remove the oldest entry from the linked list and lookup
-                self.lookup.pop(self.linked_list.tail.query, None)
-                self.linked_list.remove_from_tail()
-            else:
-                self.size += 1
+                self._evict()
             # Add the new key and value
-            new_node = Node(results)
+            new_node = Node(query, results, num_bytes)
             self.linked_list.append_to_front(new_node)
             self.lookup[query] = new_node
+            self.size += 1
+            self.num_bytes += num_bytes
+        if self.max_bytes is not None:
+            while self.num_bytes > self.max_bytes:
+                self._evict()
+
+    def remove(self, query):
+        node = self.lookup.pop(query, None)
+        if node is None:
+            return None
+        if self.policy is not None:
+            self.policy.remove(query)
+        else:
+            self.linked_list.remove(node)
+        self._remove_node(node)
+        return node.results
+
+    def _touch(self, node):
+        if self.policy is not None:
+            self.policy.access(node.query)
+        else:
+            self.linked_list.move_to_front(node)
+
+    def _evict(self):
+        if self.policy is not None:
+            node = self.lookup.pop(self.policy.evict())
+        else:
+            node = self.linked_list.remove_from_tail()
+            del self.lookup[node.query]
+        self._remove_node(node)
+        return node
+
+    def _remove_node(self, node):
+        self.size -= 1
+        self.num_bytes -= node.num_bytes
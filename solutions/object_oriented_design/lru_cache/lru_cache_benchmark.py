@@ -0,0 +1,49 @@
+# Running instructions (from the repository root):
+#   python -m solutions.object_oriented_design.lru_cache.lru_cache_benchmark [num_keys]
+
+import random
+import sys
+import time
+import tracemalloc
+
+from solutions.object_oriented_design.lru_cache.lru_cache import Cache
+
+
+def bench_set(cache, keys):
+    start = time.perf_counter()
+    for key in keys:
+        cache.set(key, key)
+    return len(keys) / (time.perf_counter() - start)
+
+
+def bench_get(cache, keys):
+    start = time.perf_counter()
+    for key in keys:
+        cache.get(key)
+    return len(keys) / (time.perf_counter() - start)
+
+
+def bytes_per_entry(num_keys):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = Cache(MAX_SIZE=num_keys)
+    for key in range(num_keys):
+        cache.set(key, key)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / num_keys
+
+
+def main(num_keys=1000000):
+    keys = list(range(num_keys))
+    cache = Cache(MAX_SIZE=num_keys // 2)
+    print('set (with evictions): %.0f ops/sec' % bench_set(cache, keys))
+    random.shuffle(keys)
+    print('get (50%% hit ratio):  %.0f ops/sec' % bench_get(cache, keys))
+    cache = Cache(MAX_SIZE=None, max_bytes=num_keys * 8)
+    print('set (byte bounded):   %.0f ops/sec' % bench_set(cache, keys))
+    print('memory per entry:     %.0f bytes' % bytes_per_entry(num_keys))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
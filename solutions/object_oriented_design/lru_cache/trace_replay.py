@@ -0,0 +1,65 @@
+# Running instructions (from the repository root):
+#   python -m solutions.object_oriented_design.lru_cache.trace_replay [trace_file] [cache_size]
+#
+# trace_file holds one query per line, in the order they were received.
+# Without it a synthetic trace is replayed: Zipf-distributed hot queries
+# interleaved with bursts of one-off tail queries.
+
+import random
+import sys
+
+from solutions.object_oriented_design.lru_cache.eviction_policy import \
+    ArcPolicy, TwoQueuePolicy, WTinyLfuPolicy
+from solutions.object_oriented_design.lru_cache.lru_cache import Cache
+
+
+POLICIES = {
+    'lru': None,
+    '2q': TwoQueuePolicy,
+    'arc': ArcPolicy,
+    'w-tinylfu': WTinyLfuPolicy,
+}
+
+
+def replay(queries, cache):
+    """Return the hit ratio of cache on the query stream."""
+    hits = 0
+    for query in queries:
+        if cache.get(query) is not None:
+            hits += 1
+        else:
+            cache.set(query, query)
+    return hits / len(queries)
+
+
+def read_trace(path):
+    with open(path) as trace:
+        return [line.rstrip('\n') for line in trace]
+
+
+def synthetic_trace(num_queries=500000, num_hot=20000, scan_length=5000, seed=0):
+    rng = random.Random(seed)
+    weights = [1.0 / rank for rank in range(1, num_hot + 1)]
+    hot = rng.choices(range(num_hot), weights=weights, k=num_queries)
+    queries = []
+    one_off = 0
+    for i, query in enumerate(hot):
+        queries.append('hot-%d' % query)
+        if i % (4 * scan_length) == 0:
+            for _ in range(scan_length):
+                queries.append('tail-%d' % one_off)
+                one_off += 1
+    return queries
+
+
+def main(trace_file=None, cache_size=2000):
+    queries = read_trace(trace_file) if trace_file else synthetic_trace()
+    print('%d queries, cache size %d' % (len(queries), cache_size))
+    for name, policy in POLICIES.items():
+        ratio = replay(queries, Cache(MAX_SIZE=cache_size, policy=policy))
+        print('%-10s hit ratio %.4f' % (name, ratio))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(args[0] if args else None, int(args[1]) if len(args) > 1 else 2000)
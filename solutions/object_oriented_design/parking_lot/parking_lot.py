@@ -14,12 +14,12 @@ class Vehicle(metaclass=ABCMeta):
     def __init__(self, vehicle_size, license_plate, spot_size):
         self.vehicle_size = vehicle_size
         self.license_plate = license_plate
-        self.spot_size
+        self.spot_size = spot_size
         self.spots_taken = []
 
     def clear_spots(self):
         for spot in self.spots_taken:
-            spot.remove_vehicle(self)
+            spot.remove_vehicle()
         self.spots_taken = []
 
     def take_spot(self, spot):
@@ -45,59 +45,227 @@ class Car(Vehicle):
         super(Car, self).__init__(VehicleSize.COMPACT, license_plate, spot_size=1)
 
     def can_fit_in_spot(self, spot):
-        return spot.size in (VehicleSize.LARGE, VehicleSize.COMPACT)
+        return spot.vehicle_size in (VehicleSize.LARGE, VehicleSize.COMPACT)
 
 
 class Bus(Vehicle):
 
+    SPOTS_NEEDED = 5
+
     def __init__(self, license_plate):
-        super(Bus, self).__init__(VehicleSize.LARGE, license_plate, spot_size=5)
+        super(Bus, self).__init__(VehicleSize.LARGE, license_plate, spot_size=Bus.SPOTS_NEEDED)
 
     def can_fit_in_spot(self, spot):
-        return spot.size == VehicleSize.LARGE
+        return spot.vehicle_size == VehicleSize.LARGE
 
 
 class ParkingLot(object):
 
-    def __init__(self, num_levels):
+    def __init__(self, num_levels, spots_per_level=None):
         self.num_levels = num_levels
         self.levels = []  # List of Levels
+        # Bitmaps over level indexes: bit i is set if level i has a free spot
+        # of that size, or room for a bus
+        self.levels_with_free_spot = {size: 0 for size in VehicleSize}
+        self.levels_with_bus_room = 0
+        if spots_per_level is not None:
+            for floor in range(num_levels):
+                self.add_level(Level(floor, spots_per_level))
+
+    def add_level(self, level):
+        level.parking_lot = self
+        level.index = len(self.levels)
+        self.levels.append(level)
+        self.level_changed(level)
+
+    def level_changed(self, level):
+        """Refresh the level's bits in the free-spot index."""
+        bit = 1 << level.index
+        for size in VehicleSize:
+            if level.free_counts[size]:
+                self.levels_with_free_spot[size] |= bit
+            else:
+                self.levels_with_free_spot[size] &= ~bit
+        if level.longest_large_run() >= Bus.SPOTS_NEEDED:
+            self.levels_with_bus_room |= bit
+        else:
+            self.levels_with_bus_room &= ~bit
 
     def park_vehicle(self, vehicle):
-        for level in self.levels:
-            if level.park_vehicle(vehicle):
+        if vehicle.spot_size > 1:
+            candidates = self.levels_with_bus_room
+        else:
+            candidates = 0
+            for size in Level.SPOT_PREFERENCES[vehicle.vehicle_size]:
+                candidates |= self.levels_with_free_spot[size]
+        while candidates:
+            index = (candidates & -candidates).bit_length() - 1
+            if self.levels[index].park_vehicle(vehicle):
                 return True
+            candidates &= candidates - 1
         return False
 
 
 class Level(object):
 
     SPOTS_PER_ROW = 10
-
-    def __init__(self, floor, total_spots):
+    # Spot sizes each vehicle size can use, smallest first
+    SPOT_PREFERENCES = {
+        VehicleSize.MOTORCYCLE: (VehicleSize.MOTORCYCLE, VehicleSize.COMPACT, VehicleSize.LARGE),
+        VehicleSize.COMPACT: (VehicleSize.COMPACT, VehicleSize.LARGE),
+        VehicleSize.LARGE: (VehicleSize.LARGE,),
+    }
+
+    def __init__(self, floor, total_spots, spot_sizes=None):
+        """Lay out total_spots in rows of SPOTS_PER_ROW.
+
+        Unless spot_sizes gives the size of every spot, the first quarter
+        are large, the last quarter motorcycle and the rest compact.
+
+        Free spots are tracked per spot size as one small bitmap per row,
+        with the free spots of each row counted in a sum segment tree over
+        the rows, so the first free spot is found in O(log rows) from the
+        first row with a nonzero count and that row's lowest set bit.
+        Large spots are also summarized per row by their longest free run,
+        kept in a max segment tree over the rows, so the first row with k
+        contiguous free large spots is found in O(log rows).
+        """
         self.floor = floor
         self.num_spots = total_spots
         self.available_spots = 0
         self.spots = []  # List of ParkingSpots
-
-    def spot_freed(self):
+        self.parking_lot = None
+        self.index = 0
+        if spot_sizes is None:
+            num_large = total_spots // 4
+            num_compact = total_spots - num_large - total_spots // 4
+            spot_sizes = [VehicleSize.LARGE] * num_large + \
+                [VehicleSize.COMPACT] * num_compact + \
+                [VehicleSize.MOTORCYCLE] * (total_spots - num_large - num_compact)
+        num_rows = (total_spots + self.SPOTS_PER_ROW - 1) // self.SPOTS_PER_ROW
+        self.tree_size = 1
+        while self.tree_size < num_rows:
+            self.tree_size <<= 1
+        self.row_bitmaps = {size: [0] * num_rows for size in VehicleSize}
+        # count_trees[size][tree_size + row] is the number of free spots of
+        # that size in the row, inner nodes hold the sums of their children
+        self.count_trees = {size: [0] * (2 * self.tree_size) for size in VehicleSize}
+        self.free_counts = {size: 0 for size in VehicleSize}
+        for spot_number, size in enumerate(spot_sizes):
+            row = spot_number // self.SPOTS_PER_ROW
+            self.spots.append(ParkingSpot(self, row, spot_number, 1, size))
+            self.row_bitmaps[size][row] |= 1 << spot_number % self.SPOTS_PER_ROW
+            self.count_trees[size][self.tree_size + row] += 1
+            self.free_counts[size] += 1
+            self.available_spots += 1
+        for count_tree in self.count_trees.values():
+            for node in range(self.tree_size - 1, 0, -1):
+                count_tree[node] = count_tree[2 * node] + count_tree[2 * node + 1]
+        self.run_tree = [0] * (2 * self.tree_size)
+        for row in range(num_rows):
+            self._update_row(row)
+
+    def longest_large_run(self):
+        return self.run_tree[1]
+
+    def spot_taken(self, spot):
+        self.available_spots -= 1
+        self._set_free(spot, False)
+        self._notify()
+
+    def spot_freed(self, spot):
         self.available_spots += 1
+        self._set_free(spot, True)
+        self._notify()
 
     def park_vehicle(self, vehicle):
         spot = self._find_available_spot(vehicle)
         if spot is None:
             return None
         else:
-            spot.park_vehicle(vehicle)
+            self._park_starting_at_spot(spot, vehicle)
             return spot
 
     def _find_available_spot(self, vehicle):
         """Find an available spot where vehicle can fit, or return None"""
-        pass
+        if vehicle.spot_size > 1:
+            return self._find_large_run(vehicle.spot_size)
+        for size in self.SPOT_PREFERENCES[vehicle.vehicle_size]:
+            if self.free_counts[size]:
+                # Walk down to the leftmost row with a free spot of this size
+                count_tree = self.count_trees[size]
+                node = 1
+                while node < self.tree_size:
+                    node = 2 * node if count_tree[2 * node] else 2 * node + 1
+                row = node - self.tree_size
+                row_bits = self.row_bitmaps[size][row]
+                offset = (row_bits & -row_bits).bit_length() - 1
+                return self.spots[row * self.SPOTS_PER_ROW + offset]
+        return None
 
     def _park_starting_at_spot(self, spot, vehicle):
         """Occupy starting at spot.spot_number to vehicle.spot_size."""
-        pass
+        for spot_number in range(spot.spot_number, spot.spot_number + vehicle.spot_size):
+            self.spots[spot_number].park_vehicle(vehicle)
+
+    def _find_large_run(self, length):
+        if self.run_tree[1] < length:
+            return None
+        # Walk down to the leftmost row whose longest run is long enough
+        node = 1
+        while node < self.tree_size:
+            node = 2 * node if self.run_tree[2 * node] >= length else 2 * node + 1
+        row = node - self.tree_size
+        row_start = row * self.SPOTS_PER_ROW
+        row_bits = self._row_bits(row)
+        run = 0
+        for offset in range(self.SPOTS_PER_ROW):
+            run = run + 1 if row_bits >> offset & 1 else 0
+            if run == length:
+                return self.spots[row_start + offset - length + 1]
+        return None
+
+    def _set_free(self, spot, is_free):
+        size = spot.vehicle_size
+        bit = 1 << spot.spot_number % self.SPOTS_PER_ROW
+        if is_free:
+            self.row_bitmaps[size][spot.row] |= bit
+            delta = 1
+        else:
+            self.row_bitmaps[size][spot.row] &= ~bit
+            delta = -1
+        self.free_counts[size] += delta
+        count_tree = self.count_trees[size]
+        node = self.tree_size + spot.row
+        while node:
+            count_tree[node] += delta
+            node //= 2
+        if size == VehicleSize.LARGE:
+            self._update_row(spot.row)
+
+    def _row_bits(self, row):
+        return self.row_bitmaps[VehicleSize.LARGE][row]
+
+    def _update_row(self, row):
+        row_bits = self._row_bits(row)
+        longest = run = 0
+        while row_bits:
+            if row_bits & 1:
+                run += 1
+                longest = max(longest, run)
+            else:
+                run = 0
+            row_bits >>= 1
+        node = self.tree_size + row
+        self.run_tree[node] = longest
+        node //= 2
+        while node:
+            self.run_tree[node] = max(self.run_tree[2 * node], self.run_tree[2 * node + 1])
+            node //= 2
+
+    def _notify(self):
+        if self.parking_lot is not None:
+            self.parking_lot.level_changed(self)
 
 
 class ParkingSpot(object):
@@ -119,7 +287,10 @@ class ParkingSpot(object):
         return vehicle.can_fit_in_spot(self)
 
     def park_vehicle(self, vehicle):
-        pass
+        self.vehicle = vehicle
+        vehicle.take_spot(self)
+        self.level.spot_taken(self)
 
     def remove_vehicle(self):
-        pass
+        self.vehicle = None
+        self.level.spot_freed(self)
@@ -0,0 +1,66 @@
+# Running instructions (from the repository root):
+#   python -m solutions.object_oriented_design.parking_lot.parking_lot_benchmark [num_spots]
+
+import random
+import sys
+import time
+
+from solutions.object_oriented_design.parking_lot.parking_lot import \
+    Bus, Car, Motorcycle, ParkingLot
+
+
+def linear_park(lot, vehicle):
+    """Baseline: walk every level and every spot."""
+    for level in lot.levels:
+        for start, spot in enumerate(level.spots):
+            if spot.vehicle is not None or not vehicle.can_fit_in_spot(spot):
+                continue
+            spots = level.spots[start:start + vehicle.spot_size]
+            if len(spots) == vehicle.spot_size and \
+                    all(s.vehicle is None and vehicle.can_fit_in_spot(s) and s.row == spot.row
+                        for s in spots):
+                for s in spots:
+                    s.park_vehicle(vehicle)
+                return True
+    return False
+
+
+def workload(num_ops, seed=0):
+    rng = random.Random(seed)
+    vehicle_types = [Motorcycle] * 3 + [Car] * 6 + [Bus]
+    return [(rng.random(), rng.choice(vehicle_types)) for _ in range(num_ops)]
+
+
+def run(lot, park, operations):
+    """Fill the lot to ~95%, then mix arrivals and departures."""
+    parked = []
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for i, (roll, vehicle_type) in enumerate(operations):
+        if parked and roll < 0.5:
+            parked.pop(rng.randrange(len(parked))).clear_spots()
+        else:
+            vehicle = vehicle_type('plate-%d' % i)
+            if park(lot, vehicle):
+                parked.append(vehicle)
+    return len(operations) / (time.perf_counter() - start)
+
+
+def main(num_spots=100000, num_levels=10, num_ops=20000):
+    spots_per_level = num_spots // num_levels
+    print('%d spots over %d levels' % (num_spots, num_levels))
+    for name, park, num_ops in (
+            ('bitmap + segment tree', ParkingLot.park_vehicle, num_ops),
+            ('linear scan', linear_park, num_ops // 100)):
+        lot = ParkingLot(num_levels, spots_per_level=spots_per_level)
+        # Pre-fill so searches start deep in the lot
+        prefill = [vehicle_type('prefill-%d' % i) for i, (_, vehicle_type) in
+                   enumerate(workload(int(num_spots * 0.6), seed=2))]
+        for vehicle in prefill:
+            lot.park_vehicle(vehicle)
+        rate = run(lot, park, workload(num_ops))
+        print('%-22s %10.0f ops/sec' % (name, rate))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
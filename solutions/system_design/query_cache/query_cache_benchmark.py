@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+# Running instructions (from the repository root):
+#   python -m solutions.system_design.query_cache.query_cache_benchmark [threads|batch|snapshot]
+
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from threading import Thread
+
+from solutions.system_design.query_cache.query_cache_snippets import \
+    Cache, QueryApi, ShardedCache
+
+
+def worker(cache, queries):
+    for query in queries:
+        if cache.get(query) is None:
+            cache.set(query, query)
+
+
+def bench_threads(cache, num_threads, ops_per_thread=50000, num_queries=20000):
+    workloads = [[random.randrange(num_queries) for _ in range(ops_per_thread)]
+                 for _ in range(num_threads)]
+    threads = [Thread(target=worker, args=(cache, queries)) for queries in workloads]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return num_threads * ops_per_thread / (time.perf_counter() - start)
+
+
+def main_threads():
+    print('threads  global lock ops/sec  sharded ops/sec')
+    for num_threads in (1, 2, 4, 8, 16, 32):
+        # Cache is a single LRU list behind one lock
+        global_lock = bench_threads(Cache(10000), num_threads)
+        sharded = bench_threads(ShardedCache(10000, num_shards=32), num_threads)
+        print('%7d  %19.0f  %15.0f' % (num_threads, global_lock, sharded))
+
+
+class SimulatedReverseIndex(object):
+    """Backend with a fixed round trip cost plus a small cost per query."""
+
+    def __init__(self, round_trip=0.002, per_query=0.0001):
+        self.round_trip = round_trip
+        self.per_query = per_query
+
+    def process_search(self, query):
+        time.sleep(self.round_trip + self.per_query)
+        return [query]
+
+    def process_searches(self, queries):
+        time.sleep(self.round_trip + self.per_query * len(queries))
+        return [[query] for query in queries]
+
+
+class PassThroughQueryApi(QueryApi):
+
+    def parse_query(self, query):
+        return query
+
+
+def bench_pages(process_page, pages):
+    start = time.perf_counter()
+    for page in pages:
+        process_page(page)
+    return (time.perf_counter() - start) / len(pages) * 1000
+
+
+def main_batch(num_pages=200, queries_per_page=40, num_queries=5000):
+    rng = random.Random(0)
+    pages = [[rng.randrange(num_queries) for _ in range(queries_per_page)]
+             for _ in range(num_pages)]
+    api = PassThroughQueryApi(ShardedCache(1000), SimulatedReverseIndex())
+    per_query = bench_pages(
+        lambda page: [api.process_query(query) for query in page], pages)
+    api = PassThroughQueryApi(ShardedCache(1000), SimulatedReverseIndex())
+    batched = bench_pages(api.process_queries, pages)
+    print('%d queries per page' % queries_per_page)
+    print('per-query: %.1f ms per page' % per_query)
+    print('batched:   %.1f ms per page' % batched)
+
+
+def zipf_queries(num_queries, num_distinct=100000, seed=0):
+    rng = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, num_distinct + 1)))
+    return rng.choices(range(num_distinct), cum_weights=cum_weights, k=num_queries)
+
+
+def queries_until_warm(cache, queries, target_ratio, window=1000):
+    """Return how many queries, and how many backend misses, it takes for a
+    window of queries to reach target_ratio hits; (None, None) if it never does.
+    """
+    hits = 0
+    misses = 0
+    for i, query in enumerate(queries, 1):
+        if cache.get(query) is None:
+            cache.set([query] * 10, query)
+            misses += 1
+        else:
+            hits += 1
+        if i % window == 0:
+            if hits >= target_ratio * window:
+                return i, misses
+            hits = 0
+    return None, None
+
+
+def main_snapshot(cache_size=20000, backend_latency=0.001):
+    warm_queries = zipf_queries(500000, seed=0)
+    queries = zipf_queries(500000, seed=1)
+    cache = ShardedCache(cache_size)
+    for query in warm_queries:
+        if cache.get(query) is None:
+            cache.set([query] * 10, query)
+    steady_ratio = sum(cache.get(query) is not None for query in queries[:10000]) / 10000
+    target_ratio = 0.9 * steady_ratio
+    path = os.path.join(tempfile.mkdtemp(), 'query_cache.snapshot')
+    start = time.perf_counter()
+    cache.dump_snapshot(path)
+    print('dump: %.2f s, %d bytes' % (time.perf_counter() - start, os.path.getsize(path)))
+    print('steady-state hit ratio %.3f, target %.3f' % (steady_ratio, target_ratio))
+    cold = ShardedCache(cache_size)
+    cold_warmup = queries_until_warm(cold, queries, target_ratio)
+    start = time.perf_counter()
+    restored = ShardedCache(cache_size)
+    restored.load_snapshot(path)
+    load_seconds = time.perf_counter() - start
+    restored_warmup = queries_until_warm(restored, queries, target_ratio)
+    for name, (num_queries, misses) in (('cold start', cold_warmup), ('snapshot', restored_warmup)):
+        if num_queries is None:
+            print('%-10s never reached the target' % name)
+            continue
+        print('%-10s %7d queries to warm, ~%.1f s of backend time at %.0f ms per miss' % (
+            name, num_queries, misses * backend_latency, backend_latency * 1000))
+    print('snapshot load: %.3f s' % load_seconds)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['batch']:
+        main_batch()
+    elif sys.argv[1:] == ['snapshot']:
+        main_snapshot()
+    else:
+        main_threads()
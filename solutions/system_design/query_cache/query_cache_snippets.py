@@ -1,32 +1,324 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+import heapq
+import itertools
+import mmap
+import os
+import pickle
+import re
+import struct
+import sys
+import time
+from functools import lru_cache
+from threading import Event, Lock, Thread
+
+
+MARKUP_RE = re.compile(r'<[^>]*>|&\w+;')
+TOKEN_RE = re.compile(r"\bAND\b|\bOR\b|\bNOT\b|(?:(?<!\S)-)?[^\W_]+(?:'[^\W_]+)*")
+
+SNAPSHOT_HEADER = struct.Struct('<4sI')  # magic, number of entries
+# pickled query length, pickled results length, wall-clock expiry (inf if none)
+SNAPSHOT_RECORD = struct.Struct('<IId')
+SNAPSHOT_MAGIC = b'QCS2'
+
+
+class Flight(object):
+
+    def __init__(self):
+        self.done = Event()
+        self.results = None
+        self.error = None
+
 
 class QueryApi(object):
 
-    def __init__(self, memory_cache, reverse_index_cluster):
+    def __init__(self, memory_cache, reverse_index_cluster, typo_corrections=None,
+                 parse_memo_size=10000):
         self.memory_cache = memory_cache
         self.reverse_index_cluster = reverse_index_cluster
+        self.typo_corrections = typo_corrections or {}  # key: misspelling, value: term
+        self._memoized_parse = lru_cache(maxsize=parse_memo_size)(self._parse_query)
+        self.in_flight = {}  # key: query, value: Flight
+        self.in_flight_lock = Lock()
+        self.async_in_flight = {}  # key: query, value: asyncio.Future
+        self.coalesced_requests = 0
 
     def parse_query(self, query):
         """Remove markup, break text into terms, deal with typos,
         normalize capitalization, convert to use boolean operations.
+
+        Returns a canonical key: a sorted tuple of OR'ed clauses, each a
+        (terms, excluded_terms) pair of sorted term tuples.  Terms in a
+        clause are AND'ed, so '<b>Cats</b> dogs' and 'dogs AND cats'
+        share a cache entry.  Raw strings seen recently skip parsing.
         """
-        ...
+        return self._memoized_parse(query)
+
+    def _parse_query(self, query):
+        clauses = []
+        terms, excluded = set(), set()
+        negate = False
+        for token in TOKEN_RE.findall(MARKUP_RE.sub(' ', query)):
+            if token == 'OR':
+                if terms:
+                    clauses.append((tuple(sorted(terms)), tuple(sorted(excluded))))
+                terms, excluded = set(), set()
+                negate = False
+                continue
+            if token == 'NOT':
+                negate = True
+                continue
+            if token == 'AND':
+                continue
+            if token.startswith('-'):
+                negate = True
+                token = token[1:]
+            token = token.lower()
+            term = sys.intern(self.typo_corrections.get(token, token))
+            if negate:
+                excluded.add(term)
+            else:
+                terms.add(term)
+            negate = False
+        if terms:
+            clauses.append((tuple(sorted(terms)), tuple(sorted(excluded))))
+        return tuple(sorted(set(clauses)))
 
     def process_query(self, query):
         query = self.parse_query(query)
-        results = self.memory_cache.get(query)
+        results = self.memory_cache.get(query, on_stale=self.refresh_in_background)
         if results is None:
-            results = self.reverse_index_cluster.process_search(query)
-            self.memory_cache.set(query, results)
+            results = self._search(query)
         return results
 
+    def process_queries(self, queries):
+        """Process a page's worth of queries with one cache pass and at most
+        one batched reverse index call.
+
+        Returns the results in the same order as queries.
+        """
+        queries = [self.parse_query(query) for query in queries]
+        query_to_results = self.memory_cache.get_many(
+            queries, on_stale=self.refresh_in_background)
+        misses = [query for query in dict.fromkeys(queries)
+                  if query not in query_to_results]
+        if misses:
+            query_to_results.update(self._search_many(misses))
+        return [query_to_results[query] for query in queries]
+
+    def refresh_in_background(self, query):
+        """Re-run a stale query without making the caller wait for it.
+
+        The refresh thread writes to memory_cache while callers read it, so
+        the cache must be thread-safe, as Cache and ShardedCache are.
+        """
+        Thread(target=self._refresh, args=(query,), daemon=True).start()
+
+    def _refresh(self, query):
+        try:
+            self._search(query)
+        except Exception:
+            # The stale entry keeps being served until its stale window ends
+            pass
+
+    async def process_query_async(self, query):
+        """Coroutine version of process_query for a single event loop.
+
+        Concurrent misses on the same query await one future; the backend
+        call itself runs in the default executor through _search, so asyncio
+        callers also coalesce with threaded callers.  _search writes to
+        memory_cache from the executor while the loop reads it, so
+        memory_cache must be thread-safe (Cache and ShardedCache are).
+        """
+        if not getattr(self.memory_cache, 'thread_safe', False):
+            raise TypeError('process_query_async needs a thread-safe memory_cache')
+        query = self.parse_query(query)
+        results = self.memory_cache.get(query, on_stale=self.refresh_in_background)
+        if results is not None:
+            return results
+        future = self.async_in_flight.get(query)
+        if future is not None:
+            with self.in_flight_lock:
+                self.coalesced_requests += 1
+            return await asyncio.shield(future)
+        loop = asyncio.get_running_loop()
+        future = self.async_in_flight[query] = loop.run_in_executor(None, self._search, query)
+        future.add_done_callback(lambda _: self._async_search_done(query, future))
+        # Shielded so a cancelled leader leaves the search running for the
+        # callers coalesced on it
+        return await asyncio.shield(future)
+
+    def _async_search_done(self, query, future):
+        if self.async_in_flight.get(query) is future:
+            del self.async_in_flight[query]
+        if not future.cancelled():
+            # Mark an error as retrieved even if every caller was cancelled
+            future.exception()
+
+    def _search(self, query):
+        """Query the reverse index, sharing one backend call between all
+        threads that miss on the same query at the same time.  Results
+        marked partial, from shards that timed out, are returned but not
+        cached.
+        """
+        with self.in_flight_lock:
+            flight = self.in_flight.get(query)
+            is_leader = flight is None
+            if is_leader:
+                flight = self.in_flight[query] = Flight()
+            else:
+                self.coalesced_requests += 1
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.results
+        try:
+            flight.results = self.reverse_index_cluster.process_search(query)
+            if not getattr(flight.results, 'partial', False):
+                self.memory_cache.set(flight.results, query)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.in_flight_lock:
+                del self.in_flight[query]
+            flight.done.set()
+        return flight.results
+
+    def _search_many(self, queries):
+        """Batched version of _search for distinct queries.
+
+        Queries another caller is already searching for are waited on
+        instead of being sent again.
+        """
+        leaders = {}
+        followers = {}
+        with self.in_flight_lock:
+            for query in queries:
+                flight = self.in_flight.get(query)
+                if flight is None:
+                    leaders[query] = self.in_flight[query] = Flight()
+                else:
+                    followers[query] = flight
+                    self.coalesced_requests += 1
+        query_to_results = {}
+        if leaders:
+            try:
+                batch = list(leaders)
+                results = self.reverse_index_cluster.process_searches(batch)
+                query_to_results = dict(zip(batch, results))
+                self.memory_cache.set_many({
+                    query: results for query, results in query_to_results.items()
+                    if not getattr(results, 'partial', False)})
+                for query, flight in leaders.items():
+                    flight.results = query_to_results[query]
+            except Exception as e:
+                for flight in leaders.values():
+                    flight.error = e
+                raise
+            finally:
+                with self.in_flight_lock:
+                    for query in leaders:
+                        del self.in_flight[query]
+                for flight in leaders.values():
+                    flight.done.set()
+        for query, flight in followers.items():
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            query_to_results[query] = flight.results
+        return query_to_results
+
+
+class SnapshotRecord(object):
+    """Results that are still pickled inside a memory-mapped snapshot."""
+
+    __slots__ = ('buffer', 'offset', 'length')
+
+    def __init__(self, buffer, offset, length):
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+
+    def load(self):
+        return pickle.loads(self.pickled())
+
+    def pickled(self):
+        return self.buffer[self.offset:self.offset + self.length]
+
+
+def write_snapshot(path, entries):
+    """Write (query, results, expires_at) entries to path, replacing it
+    atomically.  expires_at is a time.time() timestamp, or None.  Results
+    still held as a SnapshotRecord are copied over without unpickling.
+    """
+    temp_path = path + '.tmp'
+    count = 0
+    with open(temp_path, 'wb') as snapshot:
+        snapshot.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 0))
+        for query, results, expires_at in entries:
+            query_bytes = pickle.dumps(query, pickle.HIGHEST_PROTOCOL)
+            if isinstance(results, SnapshotRecord):
+                results_bytes = results.pickled()
+            else:
+                results_bytes = pickle.dumps(results, pickle.HIGHEST_PROTOCOL)
+            snapshot.write(SNAPSHOT_RECORD.pack(
+                len(query_bytes), len(results_bytes),
+                expires_at if expires_at is not None else float('inf')))
+            snapshot.write(query_bytes)
+            snapshot.write(results_bytes)
+            count += 1
+        snapshot.seek(0)
+        snapshot.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, count))
+    os.replace(temp_path, path)
+
+
+def read_snapshot(path):
+    """Memory-map a snapshot and yield (query, SnapshotRecord, expires_at)."""
+    with open(path, 'rb') as snapshot:
+        buffer = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, count = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError('Not a query cache snapshot: {}'.format(path))
+    offset = SNAPSHOT_HEADER.size
+    for _ in range(count):
+        query_length, results_length, expires_at = SNAPSHOT_RECORD.unpack_from(buffer, offset)
+        offset += SNAPSHOT_RECORD.size
+        query = pickle.loads(buffer[offset:offset + query_length])
+        offset += query_length
+        if expires_at == float('inf'):
+            expires_at = None
+        yield query, SnapshotRecord(buffer, offset, results_length), expires_at
+        offset += results_length
+
+
+def live_snapshot_entries(entries, stale_ttl, now=None):
+    """Skip (query, results, expires_at) entries past their stale window."""
+    now = time.time() if now is None else now
+    for entry in entries:
+        if entry[2] is None or entry[2] + stale_ttl > now:
+            yield entry
+
+
+def restore_snapshot_entry(cache, query, record, expires_at, now):
+    """Set a snapshot entry with the TTL it had left when it was dumped."""
+    if expires_at is None:
+        cache.set(record, query)
+    else:
+        cache.set(record, query, ttl=expires_at - now)
+
 
 class Node(object):
 
     def __init__(self, query, results):
         self.query = query
         self.results = results
+        self.expires_at = None
+        self.refreshing = False
+        self.prev = None
+        self.next = None
 
 
 class LinkedList(object):
@@ -36,42 +328,113 @@ class LinkedList(object):
         self.tail = None
 
     def move_to_front(self, node):
-        ...
+        if node is self.head:
+            return
+        self.remove(node)
+        self.append_to_front(node)
 
     def append_to_front(self, node):
-        ...
+        node.prev = None
+        node.next = self.head
+        if self.head is not None:
+            self.head.prev = node
+        self.head = node
+        if self.tail is None:
+            self.tail = node
 
     def remove_from_tail(self):
-        ...
+        node = self.tail
+        if node is not None:
+            self.remove(node)
+        return node
+
+    def remove(self, node):
+        if node.prev is not None:
+            node.prev.next = node.next
+        else:
+            self.head = node.next
+        if node.next is not None:
+            node.next.prev = node.prev
+        else:
+            self.tail = node.prev
+        node.prev = None
+        node.next = None
 
 
 class Cache(object):
 
-    def __init__(self, MAX_SIZE):
+    thread_safe = True
+
+    def __init__(self, MAX_SIZE, ttl=None, stale_ttl=0, clock=time.monotonic):
+        """Entries expire ttl seconds after they are set (never if ttl is None).
+
+        For stale_ttl seconds past expiry an entry is still served, but get
+        calls on_stale(query) once so the caller can refresh it in the
+        background.  Expiry times are kept in a min-heap, so expired entries
+        are dropped without scanning the whole cache.
+
+        Every public method holds self.lock, so a background refresh can set
+        entries while other threads read.  on_stale is called after the lock
+        is released.
+        """
         self.MAX_SIZE = MAX_SIZE
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.lock = Lock()
         self.size = 0
         self.lookup = {}
         self.linked_list = LinkedList()
+        self.expiry_heap = []  # (expires_at, sequence, query), lazily deleted
+        self.sequence = itertools.count()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
-    def get(self, query):
+    def get(self, query, on_stale=None):
         """Get the stored query result from the cache.
 
         Accessing a node updates its position to the front of the LRU list.
         """
-        node = self.lookup[query]
+        with self.lock:
+            results, stale = self._get(query, self.clock(), on_stale is not None)
+        if stale:
+            on_stale(query)
+        return results
+
+    def _get(self, query, now, refresh):
+        """Return (results, whether the caller should refresh the entry)."""
+        self._expire(now)
+        node = self.lookup.get(query)
         if node is None:
-            return None
+            self.misses += 1
+            return None, False
+        self.hits += 1
         self.linked_list.move_to_front(node)
-        return node.results
+        if isinstance(node.results, SnapshotRecord):
+            node.results = node.results.load()
+        stale = refresh and node.expires_at is not None and node.expires_at <= now \
+            and not node.refreshing
+        if stale:
+            node.refreshing = True
+        return node.results, stale
 
-    def set(self, results, query):
+    def set(self, results, query, ttl=None):
         """Set the result for the given query key in the cache.
 
         When updating an entry, updates its position to the front of the LRU list.
         If the entry is new and the cache is at capacity, removes the oldest entry
         before the new entry is added.
         """
-        node = self.map[query]
+        with self.lock:
+            now = self.clock()
+            ttl = ttl if ttl is not None else self.ttl
+            self._set(results, query, now, now + ttl if ttl is not None else None)
+
+    def _set(self, results, query, now, expires_at):
+        self._expire(now)
+        node = self.lookup.get(query)
         if node is not None:
             # Key exists in cache, update the value
             node.results = results
@@ -82,9 +445,179 @@ class Cache(object):
                 # Remove the oldest entry from the linked list and lookup
                 self.lookup.pop(self.linked_list.tail.query, None)
                 self.linked_list.remove_from_tail()
+                self.evictions += 1
             else:
                 self.size += 1
             # Add the new key and value
-            new_node = Node(query, results)
-            self.linked_list.append_to_front(new_node)
-            self.lookup[query] = new_node
+            node = Node(query, results)
+            self.linked_list.append_to_front(node)
+            self.lookup[query] = node
+        node.expires_at = expires_at
+        node.refreshing = False
+        if expires_at is not None:
+            heapq.heappush(self.expiry_heap, (expires_at, next(self.sequence), query))
+            if len(self.expiry_heap) > 2 * self.size + 64:
+                self._compact_expiry_heap()
+
+    def get_many(self, queries, on_stale=None):
+        """Return a dict of query to results for the queries that are cached."""
+        query_to_results = {}
+        stale_queries = []
+        with self.lock:
+            now = self.clock()
+            for query in queries:
+                results, stale = self._get(query, now, on_stale is not None)
+                if results is not None:
+                    query_to_results[query] = results
+                if stale:
+                    stale_queries.append(query)
+        for query in stale_queries:
+            on_stale(query)
+        return query_to_results
+
+    def set_many(self, query_to_results, ttl=None):
+        with self.lock:
+            now = self.clock()
+            ttl = ttl if ttl is not None else self.ttl
+            expires_at = now + ttl if ttl is not None else None
+            for query, results in query_to_results.items():
+                self._set(results, query, now, expires_at)
+
+    def entries(self):
+        """Yield (query, results, expires_at) from the most to the least
+        recently used, with expires_at moved to time.time() and entries
+        past their stale window skipped.  results may still be a
+        SnapshotRecord.
+
+        The caller must hold self.lock while iterating.
+        """
+        now = self.clock()
+        wall_clock_offset = time.time() - now
+        node = self.linked_list.head
+        while node is not None:
+            expires_at = node.expires_at
+            if expires_at is None or expires_at + self.stale_ttl > now:
+                if expires_at is not None:
+                    expires_at += wall_clock_offset
+                yield node.query, node.results, expires_at
+            node = node.next
+
+    def dump_snapshot(self, path, max_entries=None):
+        """Write the max_entries hottest entries to path, hottest first.
+
+        The entries are copied under the lock and written after it is
+        released, so gets and sets are not held up by the write.
+        """
+        with self.lock:
+            entries = list(itertools.islice(self.entries(), max_entries))
+        write_snapshot(path, entries)
+
+    def load_snapshot(self, path):
+        """Fill the cache from a snapshot, keeping its LRU order.
+
+        Each entry keeps the TTL it had left when dumped; entries whose
+        stale window has passed since are skipped.  Only the queries are
+        unpickled now; each entry's results stay in the memory-mapped file
+        until the entry is first read.
+        """
+        now = time.time()
+        records = list(itertools.islice(
+            live_snapshot_entries(read_snapshot(path), self.stale_ttl, now), self.MAX_SIZE))
+        for query, record, expires_at in reversed(records):
+            restore_snapshot_entry(self, query, record, expires_at, now)
+
+    def _expire(self, now):
+        """Drop entries whose stale window has passed."""
+        heap = self.expiry_heap
+        while heap and heap[0][0] + self.stale_ttl <= now:
+            expires_at, _, query = heapq.heappop(heap)
+            node = self.lookup.get(query)
+            # Skip heap entries left behind by a later set or an eviction
+            if node is not None and node.expires_at == expires_at:
+                del self.lookup[query]
+                self.linked_list.remove(node)
+                self.size -= 1
+                self.expirations += 1
+
+    def _compact_expiry_heap(self):
+        self.expiry_heap = [(node.expires_at, next(self.sequence), query)
+                            for query, node in self.lookup.items()
+                            if node.expires_at is not None]
+        heapq.heapify(self.expiry_heap)
+
+
+class ShardedCache(object):
+
+    thread_safe = True
+
+    def __init__(self, MAX_SIZE, num_shards=16, ttl=None, stale_ttl=0):
+        """Split MAX_SIZE across num_shards independent LRU caches.
+
+        Each shard has its own lock, so threads only contend when their
+        queries hash to the same shard.
+        """
+        self.num_shards = num_shards
+        self.stale_ttl = stale_ttl
+        shard_size = max(1, MAX_SIZE // num_shards)
+        self.shards = [Cache(shard_size, ttl=ttl, stale_ttl=stale_ttl)
+                       for _ in range(num_shards)]
+
+    def _shard_index(self, query):
+        return hash(query) % self.num_shards
+
+    def get(self, query, on_stale=None):
+        return self.shards[self._shard_index(query)].get(query, on_stale)
+
+    def set(self, results, query, ttl=None):
+        self.shards[self._shard_index(query)].set(results, query, ttl)
+
+    def get_many(self, queries, on_stale=None):
+        """Look up queries taking each shard lock once."""
+        query_to_results = {}
+        for index, shard_queries in self._group_by_shard(queries).items():
+            query_to_results.update(self.shards[index].get_many(shard_queries, on_stale))
+        return query_to_results
+
+    def set_many(self, query_to_results, ttl=None):
+        for index, shard_queries in self._group_by_shard(query_to_results).items():
+            self.shards[index].set_many(
+                {query: query_to_results[query] for query in shard_queries}, ttl)
+
+    def _group_by_shard(self, queries):
+        index_to_queries = {}
+        for query in queries:
+            index_to_queries.setdefault(self._shard_index(query), []).append(query)
+        return index_to_queries
+
+    def dump_snapshot(self, path, max_entries=None):
+        """Write the hottest entries of all shards, interleaving the shards'
+        LRU lists so the file stays roughly in global recency order.  Only
+        one shard is locked at a time, while its entries are copied.
+        """
+        shard_entries = []
+        for shard in self.shards:
+            with shard.lock:
+                shard_entries.append(list(itertools.islice(shard.entries(), max_entries)))
+        interleaved = itertools.chain.from_iterable(itertools.zip_longest(*shard_entries))
+        entries = (entry for entry in interleaved if entry is not None)
+        write_snapshot(path, itertools.islice(entries, max_entries))
+
+    def load_snapshot(self, path):
+        now = time.time()
+        records = list(live_snapshot_entries(read_snapshot(path), self.stale_ttl, now))
+        for query, record, expires_at in reversed(records):
+            restore_snapshot_entry(self, query, record, expires_at, now)
+
+    def stats(self):
+        """Return the hit/miss/eviction counters of each shard."""
+        stats = []
+        for shard in self.shards:
+            with shard.lock:
+                stats.append({
+                    'size': shard.size,
+                    'hits': shard.hits,
+                    'misses': shard.misses,
+                    'evictions': shard.evictions,
+                    'expirations': shard.expirations,
+                })
+        return stats
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import math
+import re
+import zlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, wait
+from threading import Lock
+
+from solutions.system_design.query_cache.query_cache_snippets import MARKUP_RE
+
+
+TERM_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+
+
+class PostingList(object):
+    """Doc ids in increasing order with the term frequency of each,
+    kept in parallel typed arrays (6 bytes per posting).
+    """
+
+    __slots__ = ('doc_ids', 'term_frequencies')
+
+    def __init__(self):
+        self.doc_ids = array('I')
+        self.term_frequencies = array('H')
+
+    def append(self, doc_id, term_frequency):
+        self.doc_ids.append(doc_id)
+        self.term_frequencies.append(min(term_frequency, 0xFFFF))
+
+
+def gallop(doc_ids, target, lo):
+    """Return the first index >= lo whose doc id is >= target."""
+    step = 1
+    hi = lo
+    size = len(doc_ids)
+    while hi < size and doc_ids[hi] < target:
+        lo = hi + 1
+        hi += step
+        step <<= 1
+    return bisect_left(doc_ids, target, lo, min(hi, size))
+
+
+def intersect(shorter, longer):
+    """Intersect two sorted doc id sequences, galloping through the longer."""
+    result = array('I')
+    position = 0
+    size = len(longer)
+    for doc_id in shorter:
+        position = gallop(longer, doc_id, position)
+        if position == size:
+            break
+        if longer[position] == doc_id:
+            result.append(doc_id)
+    return result
+
+
+def difference(doc_ids, excluded):
+    result = array('I')
+    position = 0
+    size = len(excluded)
+    for doc_id in doc_ids:
+        position = gallop(excluded, doc_id, position)
+        if position == size or excluded[position] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+class ReverseIndex(object):
+    """In-memory inverted index that can stand in for reverse_index_cluster.
+
+    Pages are added through generate, so the index can be passed to
+    web_crawler_snippets.Crawler as its reverse_index_queue.  Searches take
+    the canonical keys built by QueryApi.parse_query and rank matches with
+    BM25.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        self.postings = {}  # key: term, value: PostingList
+        self.urls = []  # index: doc id
+        self.doc_lengths = array('I')
+        self.url_to_doc_id = {}
+        self.deleted_doc_ids = set()
+        self.total_length = 0
+
+    def generate(self, page):
+        """Index the page, replacing any earlier version of the same url."""
+        self.add_document(page.url, page.contents)
+
+    def add_document(self, url, contents):
+        old_doc_id = self.url_to_doc_id.get(url)
+        if old_doc_id is not None:
+            self.deleted_doc_ids.add(old_doc_id)
+            self.total_length -= self.doc_lengths[old_doc_id]
+        doc_id = len(self.urls)
+        term_counts = {}
+        for term in TERM_RE.findall(MARKUP_RE.sub(' ', contents or '')):
+            term = term.lower()
+            term_counts[term] = term_counts.get(term, 0) + 1
+        for term, count in term_counts.items():
+            posting_list = self.postings.get(term)
+            if posting_list is None:
+                posting_list = self.postings[term] = PostingList()
+            posting_list.append(doc_id, count)
+        length = sum(term_counts.values())
+        self.urls.append(url)
+        self.doc_lengths.append(length)
+        self.url_to_doc_id[url] = doc_id
+        self.total_length += length
+        return doc_id
+
+    @property
+    def num_documents(self):
+        return len(self.urls) - len(self.deleted_doc_ids)
+
+    def process_search(self, query):
+        return [url for _, url in self.search(query)]
+
+    def process_searches(self, queries):
+        return [self.process_search(query) for query in queries]
+
+    def search(self, query, top_k=None):
+        """Return up to top_k (score, url) pairs, best first."""
+        doc_id_to_score = {}
+        for terms, excluded_terms in query:
+            for doc_id, score in self._score_clause(terms, excluded_terms):
+                doc_id_to_score[doc_id] = doc_id_to_score.get(doc_id, 0.0) + score
+        best = heapq.nlargest(top_k or self.top_k, doc_id_to_score.items(),
+                              key=lambda item: item[1])
+        return [(score, self.urls[doc_id]) for doc_id, score in best]
+
+    def _score_clause(self, terms, excluded_terms):
+        posting_lists = [self.postings.get(term) for term in terms]
+        if not posting_lists or None in posting_lists:
+            return []
+        # Intersect the rarest terms first so the candidate set shrinks fast
+        posting_lists.sort(key=lambda posting_list: len(posting_list.doc_ids))
+        doc_ids = posting_lists[0].doc_ids
+        for posting_list in posting_lists[1:]:
+            doc_ids = intersect(doc_ids, posting_list.doc_ids)
+            if not doc_ids:
+                return []
+        for term in excluded_terms:
+            posting_list = self.postings.get(term)
+            if posting_list is not None:
+                doc_ids = difference(doc_ids, posting_list.doc_ids)
+        num_documents = max(self.num_documents, 1)
+        average_length = max(self.total_length / num_documents, 1.0)
+        idfs = [math.log(1 + (num_documents - len(posting_list.doc_ids) + 0.5) /
+                         (len(posting_list.doc_ids) + 0.5))
+                for posting_list in posting_lists]
+        # doc_ids is sorted, so each posting list is walked forward only once
+        positions = [0] * len(posting_lists)
+        scores = []
+        for doc_id in doc_ids:
+            if doc_id in self.deleted_doc_ids:
+                continue
+            norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / average_length)
+            score = 0.0
+            for i, posting_list in enumerate(posting_lists):
+                positions[i] = gallop(posting_list.doc_ids, doc_id, positions[i])
+                tf = posting_list.term_frequencies[positions[i]]
+                score += idfs[i] * tf * (self.K1 + 1) / (tf + norm)
+            scores.append((doc_id, score))
+        return scores
+
+
+# The ReverseIndex owned by a ShardedReverseIndex worker process
+_shard_index = None
+
+
+def _init_shard(top_k):
+    global _shard_index
+    _shard_index = ReverseIndex(top_k)
+
+
+def _shard_add_documents(documents):
+    for url, contents in documents:
+        _shard_index.add_document(url, contents)
+
+
+def _shard_search(query, top_k):
+    return _shard_index.search(query, top_k)
+
+
+def _shard_search_many(queries, top_k):
+    return [_shard_index.search(query, top_k) for query in queries]
+
+
+class PartialResults(list):
+    """Search results missing the shards that timed out; not to be cached."""
+
+    partial = True
+
+
+class ShardedReverseIndex(object):
+    """Document-partitioned ReverseIndex spread over worker processes.
+
+    Each url is routed to one of num_shards shards, each running in its own
+    single-worker process so its documents are indexed in order.  A search
+    first waits for pending documents to be indexed, then is scattered to
+    every shard and the per-shard top k lists are merged.  Shards that miss
+    shard_timeout are left out of the results, returned as PartialResults,
+    when partial_results is set; otherwise, or when every shard misses, the
+    search raises TimeoutError.  A shard still running a timed-out search
+    is skipped by later searches until it finishes, so slow searches do not
+    queue up behind each other.  A batch of searches is sent to each shard
+    as one task, under the same timeout.  Scores use per-shard term
+    statistics.
+    """
+
+    def __init__(self, num_shards=4, top_k=10, shard_timeout=0.5,
+                 partial_results=True, batch_size=1000):
+        self.num_shards = num_shards
+        self.top_k = top_k
+        self.shard_timeout = shard_timeout
+        self.partial_results = partial_results
+        self.batch_size = batch_size
+        self.shards = [ProcessPoolExecutor(max_workers=1, initializer=_init_shard,
+                                           initargs=(top_k,))
+                       for _ in range(num_shards)]
+        self.pending_documents = [[] for _ in range(num_shards)]
+        self.pending_lock = Lock()  # add_document may run on crawler threads
+        self.indexing = [[] for _ in range(num_shards)]  # futures of submitted batches
+        self.timed_out_searches = [None] * num_shards  # future still holding each shard
+        self.partial_searches = 0
+
+    def _shard_index(self, url):
+        # crc32 rather than hash() so routing is stable across processes
+        return zlib.crc32(url.encode('utf-8')) % self.num_shards
+
+    def generate(self, page):
+        self.add_document(page.url, page.contents)
+
+    def add_document(self, url, contents):
+        index = self._shard_index(url)
+        with self.pending_lock:
+            pending = self.pending_documents[index]
+            pending.append((url, contents))
+            if len(pending) < self.batch_size:
+                return
+        self._flush(index)
+
+    def _flush(self, index):
+        # Swap the batch out before submitting it: the executor pickles it
+        # later, on its own thread
+        with self.pending_lock:
+            documents = self.pending_documents[index]
+            self.pending_documents[index] = []
+        if documents:
+            self.indexing[index].append(self.shards[index].submit(_shard_add_documents, documents))
+
+    def wait_for_indexing(self):
+        """Index every pending document, raising any indexing error."""
+        for index in range(self.num_shards):
+            self._flush(index)
+            batches, self.indexing[index] = self.indexing[index], []
+            for future in batches:
+                future.result()
+
+    def process_search(self, query):
+        return self._urls(self.search(query))
+
+    def process_searches(self, queries):
+        return [self._urls(results) for results in self.searches(queries)]
+
+    def _urls(self, results):
+        urls = [url for _, url in results]
+        return PartialResults(urls) if isinstance(results, PartialResults) else urls
+
+    def search(self, query, top_k=None):
+        """Return up to top_k (score, url) pairs, best first."""
+        top_k = top_k or self.top_k
+        shard_results, num_missed = self._scatter(_shard_search, query, top_k)
+        if num_missed:
+            self.partial_searches += 1
+        return self._merge(shard_results, top_k, num_missed)
+
+    def searches(self, queries, top_k=None):
+        """Batched search: one task per shard for all of queries."""
+        if not queries:
+            return []
+        top_k = top_k or self.top_k
+        shard_results, num_missed = self._scatter(_shard_search_many, list(queries), top_k)
+        if num_missed:
+            self.partial_searches += len(queries)
+        return [self._merge(query_results, top_k, num_missed)
+                for query_results in zip(*shard_results)]
+
+    def _scatter(self, function, *args):
+        """Run function(*args) on every shard that is not still busy with a
+        timed-out search; return the results of the shards that answered
+        within shard_timeout and the number of shards that did not.
+        """
+        self.wait_for_indexing()
+        futures = []
+        for index, shard in enumerate(self.shards):
+            busy = self.timed_out_searches[index]
+            if busy is not None and not busy.done():
+                continue
+            self.timed_out_searches[index] = None
+            futures.append((index, shard.submit(function, *args)))
+        done, _ = wait([future for _, future in futures], timeout=self.shard_timeout)
+        for index, future in futures:
+            if future not in done and not future.cancel():
+                self.timed_out_searches[index] = future
+        num_missed = self.num_shards - len(done)
+        if num_missed == self.num_shards or (num_missed and not self.partial_results):
+            raise TimeoutError('%d of %d shards timed out' % (num_missed, self.num_shards))
+        return [future.result() for _, future in futures if future in done], num_missed
+
+    def _merge(self, shard_results, top_k, num_missed):
+        # Each shard returns its results best first, so a heap merge of the
+        # sorted lists yields the global top k
+        merged = heapq.merge(*shard_results, key=lambda result: result[0], reverse=True)
+        results = list(itertools.islice(merged, top_k))
+        return PartialResults(results) if num_missed else results
+
+    def shutdown(self):
+        for shard in self.shards:
+            shard.shutdown()
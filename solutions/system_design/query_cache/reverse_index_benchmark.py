@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# Running instructions (from the repository root):
+#   python -m solutions.system_design.query_cache.reverse_index_benchmark
+
+import itertools
+import random
+import time
+
+from solutions.system_design.query_cache.query_cache_snippets import QueryApi
+from solutions.system_design.query_cache.reverse_index import ReverseIndex
+from solutions.system_design.web_crawler.web_crawler_snippets import Page
+
+
+def synthetic_pages(num_pages, vocabulary_size=50000, words_per_page=100, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ['w%d' % i for i in range(vocabulary_size)]
+    cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, vocabulary_size + 1)))
+    for i in range(num_pages):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=words_per_page)
+        yield Page('http://example.com/%d' % i, ' '.join(words), child_urls=[])
+
+
+def synthetic_queries(num_queries, seed=1):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(num_queries):
+        terms = ['w%d' % rng.randrange(10, 2000) for _ in range(rng.randint(1, 3))]
+        if rng.random() < 0.2:
+            terms.append('OR w%d' % rng.randrange(10, 2000))
+        queries.append(' '.join(terms))
+    return queries
+
+
+def main(corpus_sizes=(10000, 50000, 100000), num_queries=2000):
+    api = QueryApi(memory_cache=None, reverse_index_cluster=None)
+    queries = [api.parse_query(query) for query in synthetic_queries(num_queries)]
+    print('documents  index seconds  queries/sec')
+    for corpus_size in corpus_sizes:
+        index = ReverseIndex()
+        start = time.perf_counter()
+        for page in synthetic_pages(corpus_size):
+            index.generate(page)
+        index_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for query in queries:
+            index.process_search(query)
+        queries_per_second = num_queries / (time.perf_counter() - start)
+        print('%9d  %13.1f  %11.0f' % (corpus_size, index_seconds, queries_per_second))
+
+
+if __name__ == '__main__':
+    main()
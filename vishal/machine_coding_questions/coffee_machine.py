@@ -19,19 +19,27 @@
 # 1. On console: python coffee_machine.py
 # 2. Above line will setup the system and run test cases and print relevant output
 # 3. If want to test with different input change fixture in get_fixture method.
+# 4. python coffee_machine.py benchmark measures dispenses/sec at 3, 16 and 64 outlets.
 
+import contextlib
+import os
+import sys
+import time
 from threading import Lock, BoundedSemaphore, Thread
 
 
 class CoffeeMachine:
     def __init__(self, outlets, beverage_names, ingredient_to_quantity_map=None,
-                 ingredient_to_threshold_for_notification=None):
+                 ingredient_to_threshold_for_notification=None, preparation_time=0.0):
         self.id = id(self)
         self.outlets = outlets
         self.beverage_names = beverage_names
         self.ingredient_to_quantity_map = ingredient_to_quantity_map or {}
         self.ingredient_to_threshold_for_notification = ingredient_to_threshold_for_notification or {}
-        self.lock = Lock()  # for handling concurrent access to quantity maps
+        self.preparation_time = preparation_time  # same for every beverage
+        self.lock = Lock()  # for adding new ingredients to the quantity map
+        # one lock per ingredient quantity, a dispense only holds the ones it needs
+        self.ingredient_locks = {name: Lock() for name in self.ingredient_to_quantity_map}
         self.outlet_semaphore = BoundedSemaphore(value=outlets)  # to allow maximum of #outlets dispense requests
 
 
@@ -70,7 +78,7 @@ class MachineManager(metaclass=SingletonMetaClass):
         self.ingredient_manager = IngredientManager()  # this will return the singleton of IngredientManager new object won't be created
 
     def create(self, no_of_outlet, beverage_names, ingredient_to_quantity_map=None,
-               ingredient_to_threshold_for_notification=None):
+               ingredient_to_threshold_for_notification=None, preparation_time=0.0):
 
         # validations
         ingredient_names = set(
@@ -85,7 +93,8 @@ class MachineManager(metaclass=SingletonMetaClass):
 
         cm = CoffeeMachine(outlets=no_of_outlet, beverage_names=beverage_names,
                            ingredient_to_quantity_map=ingredient_to_quantity_map,
-                           ingredient_to_threshold_for_notification=ingredient_to_threshold_for_notification)
+                           ingredient_to_threshold_for_notification=ingredient_to_threshold_for_notification,
+                           preparation_time=preparation_time)
         self.coffee_machine_id_to_coffee_machine_map[cm.id] = cm
         return cm.id
 
@@ -111,12 +120,15 @@ class MachineManager(metaclass=SingletonMetaClass):
         self.__validate_ingredient_name(ingredient_name)
         cm = self.coffee_machine_id_to_coffee_machine_map[coffee_machine_id]
         with cm.lock:
-            if ingredient_name not in cm.ingredient_to_quantity_map:
+            if ingredient_name not in cm.ingredient_locks:
+                # the lock is published last: reservers look the ingredient up by it
                 cm.ingredient_to_quantity_map[ingredient_name] = 0
+                cm.ingredient_locks[ingredient_name] = Lock()
+        with cm.ingredient_locks[ingredient_name]:
             cm.ingredient_to_quantity_map[ingredient_name] += quantity
-            self.__update_coffee_machine(cm)
-            print("Coffee machine(id: %s) ingredient quantities after adding %s: %s" % (
-                coffee_machine_id, ingredient_name, cm.ingredient_to_quantity_map))
+        self.__update_coffee_machine(cm)
+        print("Coffee machine(id: %s) ingredient quantities after adding %s: %s" % (
+            coffee_machine_id, ingredient_name, dict(cm.ingredient_to_quantity_map)))
 
     def __update_coffee_machine(self, cm):
         self.coffee_machine_id_to_coffee_machine_map[cm.id] = cm
@@ -131,26 +143,45 @@ class MachineManager(metaclass=SingletonMetaClass):
                 raise Exception("Asked beverage not available in this machine.")
             required_ingredient_to_quantity_map = beverage['ingredient_to_quantity_map']
             print("%s required quantities: %s\n" % (beverage_name, required_ingredient_to_quantity_map))
-            with cm.lock:
-                print("Coffee Machine(id: %s) available quantities: %s" % (
-                    coffee_machine_id, cm.ingredient_to_quantity_map))
-                for ingredient_name, required_quantity in required_ingredient_to_quantity_map.items():
-                    if ingredient_name not in cm.ingredient_to_quantity_map:
-                        raise Exception(
-                            "%s cannot be prepared because %s is not available" % (beverage_name, ingredient_name))
-                    if required_quantity > cm.ingredient_to_quantity_map[ingredient_name]:
-                        raise Exception(
-                            "%s cannot be prepared because item %s is 0" % (beverage_name, ingredient_name))
-                for ingredient_name, required_quantity in required_ingredient_to_quantity_map.items():
-                    cm.ingredient_to_quantity_map[ingredient_name] -= required_quantity
-                    if cm.ingredient_to_quantity_map[
-                        ingredient_name] <= cm.ingredient_to_threshold_for_notification.get(
-                        ingredient_name, 0):
-                        self.notify_low_on_ingredient(ingredient_name)
-                self.__update_coffee_machine(cm)
+            low_ingredient_names = self.__reserve_ingredients(cm, beverage_name, required_ingredient_to_quantity_map)
+            for ingredient_name in low_ingredient_names:
+                self.notify_low_on_ingredient(ingredient_name)
+            if cm.preparation_time:
+                # ingredients are reserved, so outlets prepare in parallel
+                time.sleep(cm.preparation_time)
             print("%s is prepared.\n" % (beverage_name))
             print("Coffee Machine(id: %s) available quantities: %s\n" % (
-                coffee_machine_id, cm.ingredient_to_quantity_map))
+                coffee_machine_id, dict(cm.ingredient_to_quantity_map)))
+
+    def __reserve_ingredients(self, cm, beverage_name, required_ingredient_to_quantity_map):
+        """Check and take every required quantity atomically, holding only
+        the locks of those ingredients; return the ones now running low.
+        Locks are taken in name order so concurrent reservations can't deadlock.
+        """
+        ingredient_names = sorted(required_ingredient_to_quantity_map)
+        for ingredient_name in ingredient_names:
+            if ingredient_name not in cm.ingredient_locks:
+                raise Exception(
+                    "%s cannot be prepared because %s is not available" % (beverage_name, ingredient_name))
+        locks = [cm.ingredient_locks[ingredient_name] for ingredient_name in ingredient_names]
+        for lock in locks:
+            lock.acquire()
+        try:
+            for ingredient_name in ingredient_names:
+                if required_ingredient_to_quantity_map[ingredient_name] > cm.ingredient_to_quantity_map[ingredient_name]:
+                    raise Exception(
+                        "%s cannot be prepared because item %s is 0" % (beverage_name, ingredient_name))
+            low_ingredient_names = []
+            for ingredient_name in ingredient_names:
+                cm.ingredient_to_quantity_map[ingredient_name] -= required_ingredient_to_quantity_map[ingredient_name]
+                if cm.ingredient_to_quantity_map[ingredient_name] <= \
+                        cm.ingredient_to_threshold_for_notification.get(ingredient_name, 0):
+                    low_ingredient_names.append(ingredient_name)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        self.__update_coffee_machine(cm)
+        return low_ingredient_names
 
     def notify_low_on_ingredient(self, ingredient_name):
         print("Low on %s, please refill." % (ingredient_name))
@@ -219,10 +250,7 @@ def master():
     beverage_manager = BeverageManager()
 
     payload = get_fixture()
-    for ingredient in payload.get('ingredients', []):
-        ingredient_manager.create(ingredient)
-    for beverage in payload.get('beverages', []):
-        beverage_manager.create(beverage.get('name'), beverage.get('ingredient_to_quantity_map'))
+    setup_ingredients_and_beverages(payload)
     machine = payload.get('machine')
     cm_id = machine_manager.create(machine.get('outlets'), machine.get('beverages'), machine.get('ingredient_to_quantity_map'),
                            machine.get('ingredient_to_threshold_for_notification'))
@@ -264,6 +292,47 @@ def master():
     t4.start()
 
 
+def setup_ingredients_and_beverages(payload):
+    ingredient_manager = IngredientManager()
+    beverage_manager = BeverageManager()
+    for ingredient in payload.get('ingredients', []):
+        ingredient_manager.create(ingredient)
+    for beverage in payload.get('beverages', []):
+        beverage_manager.create(beverage.get('name'), beverage.get('ingredient_to_quantity_map'))
+
+
+def benchmark(no_of_clients=64, dispenses_per_client=500, preparation_times=(0.0, 0.005)):
+    """Dispenses/sec from no_of_clients threads at 3, 16 and 64 outlets,
+    with output discarded so printing doesn't dominate.
+    """
+    machine_manager = MachineManager()
+    payload = get_fixture()
+    setup_ingredients_and_beverages(payload)
+    beverage_names = payload['machine']['beverages']
+    print("%7s %s" % ("outlets", " ".join("%18s" % ("prep %.0f ms" % (t * 1000)) for t in preparation_times)))
+    for outlets in (3, 16, 64):
+        rates = []
+        for preparation_time in preparation_times:
+            cm_id = machine_manager.create(outlets, beverage_names,
+                                           {name: 10 ** 12 for name in payload['ingredients']}, {},
+                                           preparation_time=preparation_time)
+
+            def client(offset):
+                for i in range(dispenses_per_client):
+                    machine_manager.dispense_beverage(cm_id, beverage_names[(offset + i) % len(beverage_names)])
+
+            clients = [Thread(target=client, args=(i,)) for i in range(no_of_clients)]
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                for t in clients:
+                    t.start()
+                for t in clients:
+                    t.join()
+                elapsed = time.perf_counter() - start
+            rates.append(no_of_clients * dispenses_per_client / elapsed)
+        print("%7d %s" % (outlets, " ".join("%18.0f" % rate for rate in rates)))
+
+
 def get_fixture():
     """Right now it's hard coded dict we can change the script to take json file as input"""
     ingredients = ["hot water", "hot milk", "tea leaves syrup", "ginger syrup", "sugar syrup", "elaichi syrup",
@@ -324,4 +393,7 @@ def get_fixture():
 
 
 if __name__ == '__main__':
-    master()  # will setup and run all the test cases
+    if sys.argv[1:] == ['benchmark']:
+        benchmark()
+    else:
+        master()  # will setup and run all the test cases
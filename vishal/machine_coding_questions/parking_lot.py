@@ -1,6 +1,12 @@
+import itertools
 import math
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_left, insort
 from datetime import datetime, timedelta
-from threading import Lock
+from threading import Lock, Thread
 
 
 class VehicleType():
@@ -9,12 +15,82 @@ class VehicleType():
     ALLOWED_TYPES = (CAR, TWO_WHEELER)
 
 
+class Tariff():
+    """A rate card of [lo, hi, price] windows compiled for lookup.
+
+    A stay of h whole hours falls in the window with lo < h <= hi. Windows
+    starting at 24 hours or later charge price per started day, earlier ones
+    a flat price. Charges for the first TABLE_HOURS hours are precomputed.
+    """
+    TABLE_HOURS = 24 * 31
+
+    def __init__(self, rate_card):
+        windows = sorted(rate_card, key=lambda w: w[0])
+        for prev, w in zip(windows, windows[1:]):
+            if w[0] < prev[1]:
+                raise Exception("rate card windows overlap")
+        self.lows = [w[0] for w in windows]
+        self.highs = [w[1] for w in windows]
+        self.prices = [w[2] for w in windows]
+        self.per_day = [w[0] >= 24 for w in windows]
+        self.charges_by_hour = [self.charge_for_units(units) for units in range(self.TABLE_HOURS)]
+
+    def charge_for_units(self, units):
+        i = bisect_left(self.highs, units)
+        if i == len(self.highs) or units <= self.lows[i]:
+            return 0
+        if self.per_day[i]:
+            return -(-units // 24) * self.prices[i]
+        return self.prices[i]
+
+    def charge(self, td):
+        return self.charge_for_units(td.days * 24 + td.seconds // (60 * 60))
+
+    def compute_charges(self, durations):
+        """Charges for a batch of stay durations given in seconds."""
+        table = self.charges_by_hour
+        table_hours = len(table)
+        charge_for_units = self.charge_for_units
+        charges = []
+        for seconds in durations:
+            units = int(seconds // 3600)
+            # negative stays would index the table from the end
+            charges.append(table[units] if 0 <= units < table_hours else charge_for_units(units))
+        return charges
+
+
 class ParkingLot():
     def __init__(self, capacity_map, rate_card):
         self.id = id(self)
         self.capacity_map = capacity_map
         self.rate_card = rate_card
-        self.occupancy_map = {}
+        self.tariffs = {vehicle_type: Tariff(rate_card[vehicle_type]) for vehicle_type in capacity_map}
+        # occupancy_map[vehicle_type][slot] is the pid parked there or None;
+        # free_slots[vehicle_type] is a stack of the empty slot numbers
+        self.occupancy_map = {vehicle_type: [None] * capacity
+                              for vehicle_type, capacity in capacity_map.items()}
+        self.free_slots = {vehicle_type: list(range(capacity - 1, -1, -1))
+                           for vehicle_type, capacity in capacity_map.items()}
+        self.occupied_count = {vehicle_type: 0 for vehicle_type in capacity_map}
+        # bumped with each change of free slots, to order AvailabilityIndex updates
+        self.availability_sequence = {vehicle_type: 0 for vehicle_type in capacity_map}
+
+    def take_slot(self, vehicle_type):
+        free_slots = self.free_slots.get(vehicle_type)
+        if not free_slots:
+            raise Exception("No slot available for given vehicle type.")
+        self.occupied_count[vehicle_type] += 1
+        return free_slots.pop()
+
+    def release_slot(self, vehicle_type, slot):
+        if self.occupancy_map[vehicle_type][slot] is None:
+            raise Exception("slot already free")
+        self.occupancy_map[vehicle_type][slot] = None
+        self.free_slots[vehicle_type].append(slot)
+        self.occupied_count[vehicle_type] -= 1
+
+    def get_availability(self):
+        return {vehicle_type: len(free_slots) for vehicle_type, free_slots in self.free_slots.items()}
 
 
 class Vehicle():
@@ -24,13 +100,171 @@ class Vehicle():
 
 
 class Parking():
+    ids = itertools.count(1)  # id() would be reused once a parking moves to history
+
     def __init__(self, parking_lot_id, vehicle_number, start_time=None):
-        self.id = id(self)
+        self.id = next(Parking.ids)
         self.parking_lot_id = parking_lot_id
         self.vehicle_number = vehicle_number
         self.start_time = start_time if start_time else datetime.now()
         self.end_time = None
         self.charge = 0.0
+        self.slot = None
+
+
+class ParkingHistory():
+    """Append-only, column-per-field store of finished parkings.
+
+    Rows are appended in exit order, so end_times is non-decreasing and a
+    time range of exits is found by bisect. Vehicle numbers are interned to
+    small ints; vehicle_rows keeps each vehicle's rows in the same order.
+    Times are stored as POSIX timestamps.
+    """
+
+    def __init__(self):
+        self.parking_ids = array('q')
+        self.start_times = array('d')
+        self.end_times = array('d')
+        self.charges = array('d')
+        self.parking_lot_ids = array('q')
+        self.vehicle_ids = array('I')
+        self.vehicle_numbers = []  # index: vehicle id
+        self.vehicle_number_to_vehicle_id = {}
+        self.vehicle_rows = {}  # key: vehicle id, value: array of rows
+        self.parking_id_to_row = {}
+
+    def __len__(self):
+        return len(self.end_times)
+
+    def append(self, parking):
+        vehicle_id = self.vehicle_number_to_vehicle_id.get(parking.vehicle_number)
+        if vehicle_id is None:
+            vehicle_id = len(self.vehicle_numbers)
+            self.vehicle_numbers.append(parking.vehicle_number)
+            self.vehicle_number_to_vehicle_id[parking.vehicle_number] = vehicle_id
+            self.vehicle_rows[vehicle_id] = array('I')
+        row = len(self.end_times)
+        self.parking_ids.append(parking.id)
+        self.start_times.append(parking.start_time.timestamp())
+        self.end_times.append(parking.end_time.timestamp())
+        self.charges.append(parking.charge)
+        self.parking_lot_ids.append(parking.parking_lot_id)
+        self.vehicle_ids.append(vehicle_id)
+        self.vehicle_rows[vehicle_id].append(row)
+        self.parking_id_to_row[parking.id] = row
+        return row
+
+    def get_row(self, row):
+        return {'id': self.parking_ids[row],
+                'parking_lot_id': self.parking_lot_ids[row],
+                'vehicle_number': self.vehicle_numbers[self.vehicle_ids[row]],
+                'start_time': datetime.fromtimestamp(self.start_times[row]),
+                'end_time': datetime.fromtimestamp(self.end_times[row]),
+                'charge': self.charges[row]}
+
+    def rows_between(self, start=None, end=None):
+        """Rows of parkings that ended in [start, end)."""
+        lo = bisect_left(self.end_times, start.timestamp()) if start else 0
+        hi = bisect_left(self.end_times, end.timestamp()) if end else len(self.end_times)
+        return range(lo, hi)
+
+    def vehicle_history(self, vehicle_number, start=None, end=None):
+        """Yield the vehicle's parkings that ended in [start, end), oldest first."""
+        vehicle_id = self.vehicle_number_to_vehicle_id.get(vehicle_number)
+        if vehicle_id is None:
+            return
+        rows = self.vehicle_rows[vehicle_id]
+        end_times = self.end_times
+        lo = bisect_left(rows, start.timestamp(), key=end_times.__getitem__) if start else 0
+        hi = bisect_left(rows, end.timestamp(), key=end_times.__getitem__) if end else len(rows)
+        for i in range(lo, hi):
+            yield self.get_row(rows[i])
+
+    def revenue_by_lot_hour(self, start=None, end=None):
+        """Yield (hour, parking_lot_id, revenue) for exits in [start, end),
+        hour by hour, with hour the local datetime the hour starts at.
+        """
+        return self.revenue_by_rows(self.rows_between(start, end))
+
+    def revenue_by_rows(self, rows):
+        """revenue_by_lot_hour over a range of rows from rows_between."""
+        current_hour = None
+        next_hour_start = -math.inf
+        lot_to_revenue = {}
+        for row in rows:
+            end_time = self.end_times[row]
+            if end_time >= next_hour_start:
+                # local hours, so the buckets match the labels in any timezone
+                hour = datetime.fromtimestamp(end_time).replace(minute=0, second=0, microsecond=0)
+                next_hour_start = hour.timestamp() + 3600
+                if hour != current_hour:
+                    for item in self.__hour_revenue(current_hour, lot_to_revenue):
+                        yield item
+                    current_hour = hour
+                    lot_to_revenue = {}
+            lot_id = self.parking_lot_ids[row]
+            lot_to_revenue[lot_id] = lot_to_revenue.get(lot_id, 0) + self.charges[row]
+        for item in self.__hour_revenue(current_hour, lot_to_revenue):
+            yield item
+
+    def __hour_revenue(self, hour, lot_to_revenue):
+        for lot_id, revenue in lot_to_revenue.items():
+            yield hour, lot_id, revenue
+
+
+class AvailabilityIndex():
+    """Lots with free slots for each vehicle type, bucketed by free count.
+
+    buckets[vehicle_type][free] holds the lots with that many free slots and
+    counts[vehicle_type] is the sorted list of non-empty bucket sizes, so
+    the lots with the most room are read from the top without a scan. Full
+    lots are not indexed.
+
+    Each vehicle type has its own lock. Lots publish their free counts with
+    a per-lot sequence number and apply them after releasing the lot lock,
+    so an update that arrives after a newer one is dropped.
+    """
+
+    def __init__(self):
+        self.locks = {vehicle_type: Lock() for vehicle_type in VehicleType.ALLOWED_TYPES}
+        self.sequences = {vehicle_type: {} for vehicle_type in VehicleType.ALLOWED_TYPES}
+        self.free = {vehicle_type: {} for vehicle_type in VehicleType.ALLOWED_TYPES}
+        self.buckets = {vehicle_type: {} for vehicle_type in VehicleType.ALLOWED_TYPES}
+        self.counts = {vehicle_type: [] for vehicle_type in VehicleType.ALLOWED_TYPES}
+
+    def update(self, vehicle_type, parking_lot_id, free, sequence):
+        with self.locks[vehicle_type]:
+            sequences = self.sequences[vehicle_type]
+            if sequence <= sequences.get(parking_lot_id, -1):
+                return
+            sequences[parking_lot_id] = sequence
+            buckets = self.buckets[vehicle_type]
+            counts = self.counts[vehicle_type]
+            old = self.free[vehicle_type].pop(parking_lot_id, 0)
+            if old:
+                bucket = buckets[old]
+                del bucket[parking_lot_id]
+                if not bucket:
+                    del buckets[old]
+                    del counts[bisect_left(counts, old)]
+            if free:
+                self.free[vehicle_type][parking_lot_id] = free
+                if free not in buckets:
+                    buckets[free] = {}
+                    insort(counts, free)
+                buckets[free][parking_lot_id] = None
+
+    def find_available(self, vehicle_type, k=1):
+        """Up to k (parking_lot_id, free slots) pairs, most free slots first."""
+        result = []
+        with self.locks[vehicle_type]:
+            buckets = self.buckets[vehicle_type]
+            for free in reversed(self.counts.get(vehicle_type, [])):
+                for parking_lot_id in buckets[free]:
+                    result.append((parking_lot_id, free))
+                    if len(result) == k:
+                        return result
+        return result
 
 
 class SingletonMetaClass(type):
@@ -50,18 +284,33 @@ class SingletonMetaClass(type):
 
 
 class ParkingLotManager(metaclass=SingletonMetaClass):
+    VEHICLE_LOCK_STRIPES = 64
+
     def __init__(self):
         self.parking_lot_id_to_parking_lot = {}
         self.vehicle_manager = VehicleManager()
         self.parking_manager = ParkingManager()
         self.parking_lot_id_to_vehicle_parking_map = {}
+        # a vehicle number is in here from the moment its parking is reserved
+        # until its exit is complete, guarded by the vehicle's lock stripe
         self.vehicle_id_to_pl_id = {}
-        self.db_lock = Lock()
+        self.vehicle_locks = [Lock() for _ in range(self.VEHICLE_LOCK_STRIPES)]
+        self.availability_index = AvailabilityIndex()
+
+    def __vehicle_lock(self, vehicle_number):
+        return self.vehicle_locks[hash(vehicle_number) % self.VEHICLE_LOCK_STRIPES]
 
     def register_parking_lot(self, capacity_map, rate_card):
-        # todo: validate capacity_map and rate_card
+        for vehicle_type in capacity_map:
+            if vehicle_type not in VehicleType.ALLOWED_TYPES:
+                raise Exception("Invalid vehicle type.")
+            if vehicle_type not in rate_card:
+                raise Exception("No rate card for %s" % vehicle_type)
         pl = ParkingLot(capacity_map=capacity_map, rate_card=rate_card)
-        pl.lock = Lock()
+        pl.lock = Lock()  # guards the lot's slots and counters only
+        self.parking_lot_id_to_vehicle_parking_map[pl.id] = {}
+        for vehicle_type, free in pl.get_availability().items():
+            self.availability_index.update(vehicle_type, pl.id, free, 0)
         self.parking_lot_id_to_parking_lot[pl.id] = pl
         return pl.id
 
@@ -70,90 +319,116 @@ class ParkingLotManager(metaclass=SingletonMetaClass):
             raise Exception("No parking lot with given id")
         pl = self.parking_lot_id_to_parking_lot[parking_lot_id]
         vehicle_type = self.vehicle_manager.get_vehicle_type(vehicle_number)
-        with pl.lock:
-            total_capacity = pl.capacity_map[vehicle_type]
-            occupied = len(pl.occupancy_map.get(vehicle_type, []))
+        # reserve the vehicle first so it can't be parked twice concurrently
+        with self.__vehicle_lock(vehicle_number):
             if vehicle_number in self.vehicle_id_to_pl_id:
                 raise Exception("vehicle already parked somewhere")
-            if occupied < total_capacity:
-                if vehicle_type not in pl.occupancy_map:
-                    pl.occupancy_map[vehicle_type] = []
-                pid = self.parking_manager.occupy(pl.id, vehicle_number)
-                pl.occupancy_map[vehicle_type].append(pid)
-                self.vehicle_manager.register_parking(vehicle_number, pid)
-                if pl.id not in self.parking_lot_id_to_vehicle_parking_map:
-                    self.parking_lot_id_to_vehicle_parking_map[pl.id] = {}
-                self.parking_lot_id_to_vehicle_parking_map[pl.id][vehicle_number] = pid
-                self.vehicle_id_to_pl_id[vehicle_number] = pl.id
-                return
-            raise Exception("No slot available for given vehicle type.")
+            self.vehicle_id_to_pl_id[vehicle_number] = pl.id
+        try:
+            with pl.lock:
+                slot = pl.take_slot(vehicle_type)
+                free, sequence = self.__publish_availability(pl, vehicle_type)
+        except Exception:
+            with self.__vehicle_lock(vehicle_number):
+                self.vehicle_id_to_pl_id.pop(vehicle_number)
+            raise
+        self.availability_index.update(vehicle_type, pl.id, free, sequence)
+        pid = self.parking_manager.occupy(pl.id, vehicle_number, slot)
+        pl.occupancy_map[vehicle_type][slot] = pid  # the slot is ours until released
+        self.parking_lot_id_to_vehicle_parking_map[pl.id][vehicle_number] = pid
 
     def exit_vehicle(self, parking_lot_id, vehicle_number):
         if parking_lot_id not in self.parking_lot_id_to_parking_lot:
             raise Exception("No parking lot with given id")
         pl = self.parking_lot_id_to_parking_lot[parking_lot_id]
-        pid = self.parking_lot_id_to_vehicle_parking_map.get(pl.id, {}).get(vehicle_number)
+        # claim the exit under the vehicle's lock so only one caller frees the slot
+        with self.__vehicle_lock(vehicle_number):
+            pid = self.parking_lot_id_to_vehicle_parking_map[pl.id].pop(vehicle_number, None)
         if not pid:
             raise Exception("vehicle not parked in parking lot.")
         vehicle_type = self.vehicle_manager.get_vehicle_type(vehicle_number)
-        charge = self.parking_manager.free(pid, pl.rate_card.get(vehicle_type))
-        self.parking_lot_id_to_vehicle_parking_map[pl.id].pop(vehicle_number)
-        self.vehicle_id_to_pl_id.pop(vehicle_number)
+        slot = self.parking_manager.parking_id_to_parking[pid].slot
+        charge = self.parking_manager.free(pid, pl.tariffs[vehicle_type])
+        with pl.lock:
+            pl.release_slot(vehicle_type, slot)
+            free, sequence = self.__publish_availability(pl, vehicle_type)
+        self.availability_index.update(vehicle_type, pl.id, free, sequence)
+        with self.__vehicle_lock(vehicle_number):
+            self.vehicle_id_to_pl_id.pop(vehicle_number)
         return charge
 
+    def __publish_availability(self, pl, vehicle_type):
+        """Free count and its sequence number; call with pl.lock held."""
+        pl.availability_sequence[vehicle_type] += 1
+        return len(pl.free_slots[vehicle_type]), pl.availability_sequence[vehicle_type]
+
+    def get_availability(self, parking_lot_id):
+        if parking_lot_id not in self.parking_lot_id_to_parking_lot:
+            raise Exception("No parking lot with given id")
+        pl = self.parking_lot_id_to_parking_lot[parking_lot_id]
+        with pl.lock:
+            return pl.get_availability()
+
+    def find_available(self, vehicle_type, k=1):
+        if vehicle_type not in VehicleType.ALLOWED_TYPES:
+            raise Exception("Invalid vehicle type.")
+        return self.availability_index.find_available(vehicle_type, k)
+
 
 class ParkingManager(metaclass=SingletonMetaClass):
     def __init__(self):
-        self.parking_id_to_parking = {}
+        self.parking_id_to_parking = {}  # ongoing parkings only
+        self.history = ParkingHistory()
+        # taken only to stamp an exit time and append it, so rows stay in end_time order
+        self.history_lock = Lock()
 
     def get_by_id(self, pid):
-        if pid not in self.parking_id_to_parking:
-            raise Exception("not a valid pid")
-        return self.parking_id_to_parking[pid].__dict__
-
-    def occupy(self, parking_lot_id, vehicle_number):
+        if pid in self.parking_id_to_parking:
+            return self.parking_id_to_parking[pid].__dict__
+        with self.history_lock:
+            if pid not in self.history.parking_id_to_row:
+                raise Exception("not a valid pid")
+            return self.history.get_row(self.history.parking_id_to_row[pid])
+
+    def occupy(self, parking_lot_id, vehicle_number, slot=None):
         p = Parking(parking_lot_id=parking_lot_id, vehicle_number=vehicle_number)
+        p.slot = slot
         self.parking_id_to_parking[p.id] = p
         return p.id
 
     def get_occupying_vehicle_number(self, parking_id):
-        if parking_id not in self.parking_id_to_parking:
-            raise Exception("not a valid parking_id")
-        p = self.parking_id_to_parking[parking_id]
-        if p.end_time is not None:
+        if parking_id in self.parking_id_to_parking:
+            return self.parking_id_to_parking[parking_id].vehicle_number
+        if parking_id in self.history.parking_id_to_row:
             raise Exception("parking has been emptied.")
-        return p.vehicle_number
-
-    def free(self, parking_id, pl_charges):
-        if parking_id not in self.parking_id_to_parking:
+        raise Exception("not a valid parking_id")
+
+    def free(self, parking_id, tariff):
+        # dict.pop is atomic, so only one caller gets the parking
+        parking = self.parking_id_to_parking.pop(parking_id, None)
+        if parking is None:
+            if parking_id in self.history.parking_id_to_row:
+                raise Exception("parking already free")
             raise Exception("No parking exists with given id.")
-        parking = self.parking_id_to_parking[parking_id]
-        if parking.end_time is not None:
-            raise Exception("parking already free")
-        parking.end_time = datetime.now() + timedelta(hours=28)
-        td = (parking.end_time - parking.start_time)
-        units = td.seconds // (60 * 60)
-        units += (td.days * 24)
-        charge = 0
-        for w in pl_charges:
-            if units > w[0] and units <= w[1]:
-                if w[0] >= 24:
-                    a = units // 24
-                    if units % 24 > 0:
-                        a += 1
-                    charge = a * w[2]
-                else:
-                    charge = w[2]
-                parking.charge = charge
-                break
-        self.parking_id_to_parking[parking_id] = parking
-        return charge
+        with self.history_lock:
+            parking.end_time = datetime.now() + timedelta(hours=28)
+            row = self.history.append(parking)
+        # the charge is filled into the appended row outside the lock
+        parking.charge = tariff.charge(parking.end_time - parking.start_time)
+        self.history.charges[row] = parking.charge
+        return parking.charge
+
+    def get_revenue_by_lot_hour(self, start=None, end=None):
+        # history is append-only, so the rows fixed under the lock can be
+        # streamed after releasing it
+        with self.history_lock:
+            rows = self.history.rows_between(start, end)
+        return self.history.revenue_by_rows(rows)
 
 
 class VehicleManager(metaclass=SingletonMetaClass):
     def __init__(self):
         self.vehicle_number_to_vehicle = {}
-        self.vehicle_number_to_parking_id = {}
         self.parking_manger = ParkingManager()
 
     def add_vehicle(self, type_of_vehicle, vehicle_number):
@@ -174,16 +449,10 @@ class VehicleManager(metaclass=SingletonMetaClass):
         vehicle = self.get_vehicle_by_number(vehicle_number)
         return vehicle.type_of_vehicle
 
-    def register_parking(self, vehicle_number, parking_id):
-        vehicle = self.get_vehicle_by_number(vehicle_number)
-        if vehicle_number not in self.vehicle_number_to_parking_id:
-            self.vehicle_number_to_parking_id[vehicle_number] = []
-        self.vehicle_number_to_parking_id[vehicle_number].append(parking_id)
-
-    def get_parking_history(self, vehicle_number):
+    def get_parking_history(self, vehicle_number, start=None, end=None):
+        """Yield the vehicle's finished parkings that ended in [start, end)."""
         v = self.get_vehicle_by_number(vehicle_number)
-        for p in self.vehicle_number_to_parking_id.get(vehicle_number, []):
-            print(self.parking_manger.get_by_id(p))
+        return self.parking_manger.history.vehicle_history(vehicle_number, start, end)
 
 
 def master():
@@ -210,9 +479,172 @@ def master():
     # PL.park_vehicle(pl2, "V2")
     # PL.exit_vehicle(pl1, "V2")
     print(PL.exit_vehicle(pl2, "V2"))
-    V.get_parking_history("V2")
-    V.get_parking_history("V1")
+    print(PL.get_availability(pl1), PL.get_availability(pl2))
+    print(PL.find_available("CAR", 2))
+    for p in V.get_parking_history("V2"):
+        print(p)
+    for p in V.get_parking_history("V1", start=datetime.now()):
+        print(p)
+    for hour, lot_id, revenue in P.get_revenue_by_lot_hour():
+        print(hour, lot_id, revenue)
+
+
+def simulate_gates(no_of_gates=8, no_of_lots=4, no_of_vehicles=2000, ops_per_gate=5000):
+    """Gates park and exit random vehicles concurrently, then the lot state
+    is checked for double parking and lost or leaked slots.
+    """
+    PL = ParkingLotManager()
+    V = VehicleManager()
+    rate_card = {"TWO_WHEELER": [[0, 24, 20], [24, math.inf, 80]],
+                 "CAR": [[0, 24, 30], [24, math.inf, 100]]}
+    lot_ids = [PL.register_parking_lot({"TWO_WHEELER": 100, "CAR": 100}, rate_card)
+               for _ in range(no_of_lots)]
+    vehicle_numbers = ["SIM-%d" % i for i in range(no_of_vehicles)]
+    for i, vehicle_number in enumerate(vehicle_numbers):
+        V.add_vehicle(VehicleType.ALLOWED_TYPES[i % 2], vehicle_number)
+    counts = {"entries": 0, "exits": 0}
+    counts_lock = Lock()
+
+    def gate(seed):
+        rng = random.Random(seed)
+        entries = exits = 0
+        for _ in range(ops_per_gate):
+            vehicle_number = rng.choice(vehicle_numbers)
+            lot_id = rng.choice(lot_ids)
+            try:
+                if rng.random() < 0.5:
+                    PL.park_vehicle(lot_id, vehicle_number)
+                    entries += 1
+                else:
+                    PL.exit_vehicle(lot_id, vehicle_number)
+                    exits += 1
+            except Exception:
+                pass  # lot full, vehicle already parked or not parked here
+        with counts_lock:
+            counts["entries"] += entries
+            counts["exits"] += exits
+
+    gates = [Thread(target=gate, args=(seed,)) for seed in range(no_of_gates)]
+    start = time.perf_counter()
+    for t in gates:
+        t.start()
+    for t in gates:
+        t.join()
+    elapsed = time.perf_counter() - start
+    print("%d gates: %.0f entries/sec, %.0f exits/sec" % (
+        no_of_gates, counts["entries"] / elapsed, counts["exits"] / elapsed))
+
+    errors = []
+    parked_in = {}
+    for lot_id in lot_ids:
+        pl = PL.parking_lot_id_to_parking_lot[lot_id]
+        vehicle_parking_map = PL.parking_lot_id_to_vehicle_parking_map[lot_id]
+        for vehicle_number in vehicle_parking_map:
+            if vehicle_number in parked_in:
+                errors.append("%s parked in two lots" % vehicle_number)
+            parked_in[vehicle_number] = lot_id
+        for vehicle_type in VehicleType.ALLOWED_TYPES:
+            parked = sum(1 for v in vehicle_parking_map
+                         if V.get_vehicle_type(v) == vehicle_type)
+            if pl.occupied_count[vehicle_type] != parked:
+                errors.append("lot %s %s count %d but %d parked" % (
+                    lot_id, vehicle_type, pl.occupied_count[vehicle_type], parked))
+            if parked + len(pl.free_slots[vehicle_type]) != pl.capacity_map[vehicle_type]:
+                errors.append("lot %s lost %s slots" % (lot_id, vehicle_type))
+            if parked > pl.capacity_map[vehicle_type]:
+                errors.append("lot %s over capacity for %s" % (lot_id, vehicle_type))
+    for vehicle_number in vehicle_numbers:
+        if PL.vehicle_id_to_pl_id.get(vehicle_number) != parked_in.get(vehicle_number):
+            errors.append("%s reservation does not match its parking" % vehicle_number)
+    for vehicle_number, lot_id in parked_in.items():
+        PL.exit_vehicle(lot_id, vehicle_number)
+    for lot_id in lot_ids:
+        pl = PL.parking_lot_id_to_parking_lot[lot_id]
+        if pl.get_availability() != pl.capacity_map or any(pl.occupied_count.values()):
+            errors.append("lot %s leaked slots after every vehicle left" % lot_id)
+        for vehicle_type, capacity in pl.capacity_map.items():
+            if PL.availability_index.free[vehicle_type].get(lot_id) != capacity:
+                errors.append("availability index is stale for lot %s" % lot_id)
+    print("consistency check: %s" % ("ok" if not errors else "; ".join(errors[:5])))
+    return errors
+
+
+def benchmark_tariff(no_of_records=1000000):
+    rate_card = [[0, 1, 30], [1, 3, 70], [3, 24, 100], [24, math.inf, 100]]
+    rng = random.Random(0)
+    durations = [rng.expovariate(1 / (6 * 3600.0)) for _ in range(no_of_records)]
+
+    def linear_charge(seconds):
+        # the per-exit rate card walk this replaced
+        units = int(seconds // 3600)
+        for w in rate_card:
+            if units > w[0] and units <= w[1]:
+                if w[0] >= 24:
+                    a = units // 24
+                    if units % 24 > 0:
+                        a += 1
+                    return a * w[2]
+                return w[2]
+        return 0
+
+    tariff = Tariff(rate_card)
+    start = time.perf_counter()
+    expected = [linear_charge(seconds) for seconds in durations]
+    linear = time.perf_counter() - start
+    start = time.perf_counter()
+    single = [tariff.charge_for_units(int(seconds // 3600)) for seconds in durations]
+    bisected = time.perf_counter() - start
+    start = time.perf_counter()
+    charges = tariff.compute_charges(durations)
+    batched = time.perf_counter() - start
+    if charges != expected or single != expected:
+        raise Exception("tariff charges differ from the rate card walk")
+    print("%d records, charges/sec" % no_of_records)
+    print("rate card walk:   %.0f" % (no_of_records / linear))
+    print("bisect per call:  %.0f" % (no_of_records / bisected))
+    print("compute_charges:  %.0f" % (no_of_records / batched))
+
+
+def benchmark_availability(no_of_lots=10000, no_of_ops=100000, k=10):
+    PL = ParkingLotManager()
+    V = VehicleManager()
+    rng = random.Random(0)
+    rate_card = {"TWO_WHEELER": [[0, math.inf, 20]], "CAR": [[0, math.inf, 30]]}
+    lot_ids = [PL.register_parking_lot({"TWO_WHEELER": rng.randint(1, 50), "CAR": rng.randint(1, 200)},
+                                       rate_card)
+               for _ in range(no_of_lots)]
+    parked = []
+    update_seconds = 0.0
+    query_seconds = 0.0
+    no_of_queries = 0
+    for i in range(no_of_ops):
+        if parked and rng.random() < 0.4:
+            lot_id, vehicle_number = parked.pop(rng.randrange(len(parked)))
+            start = time.perf_counter()
+            PL.exit_vehicle(lot_id, vehicle_number)
+            update_seconds += time.perf_counter() - start
+            continue
+        start = time.perf_counter()
+        available = PL.find_available("CAR", k)
+        query_seconds += time.perf_counter() - start
+        no_of_queries += 1
+        vehicle_number = V.add_vehicle("CAR", "AV-%d" % i).vehicle_number
+        lot_id = rng.choice(available)[0]
+        start = time.perf_counter()
+        PL.park_vehicle(lot_id, vehicle_number)
+        update_seconds += time.perf_counter() - start
+        parked.append((lot_id, vehicle_number))
+    print("%d lots, %d parked" % (no_of_lots, len(parked)))
+    print("find_available(k=%d): %.1f us" % (k, query_seconds / no_of_queries * 1e6))
+    print("park/exit incl. index update: %.1f us" % (update_seconds / no_of_ops * 1e6))
 
 
 if __name__ == '__main__':
-    master()
+    if sys.argv[1:] == ['gates']:
+        simulate_gates()
+    elif sys.argv[1:] == ['tariff']:
+        benchmark_tariff()
+    elif sys.argv[1:] == ['availability']:
+        benchmark_availability()
+    else:
+        master()